@@ -1,627 +1,3129 @@
-# Nowplaying Monitor for djay by Algoriddim
-# Author: stanzas
-# Added: 2025-12-31
-# copyright (c) 2025-2026 stanzas
-# License: MIT
-# version 1.1
-import sqlite3
-import time
-import os
-import re
-import datetime
-import json
-import threading
-import socket
-import sys
-import webbrowser
-import urllib.parse
-import shutil
-import tkinter as tk
-from tkinter import scrolledtext, filedialog, messagebox
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import appdirs
-from pathlib import Path
-
-# Try to import mutagen for artwork extraction
-try:
-    import mutagen
-    HAS_MUTAGEN = True
-except ImportError:
-    HAS_MUTAGEN = False
-
-# ================= Configuration =================
-CONFIG_FILE = "config.json"
-DEFAULT_CONFIG = {
-    "db_path": None,
-    "poll_interval": 0.5,
-    "port": 8000,
-    "template_file": "template.html",
-    "show_source": True,
-    "show_history": True,
-    "show_history_time": True
-}
-# ===========================================
-
-# Global State
-server_state = {
-    "current": {
-        "artist": "-",
-        "title": "Waiting for playback...",
-        "status": "Ready",
-        "timestamp": "",
-        "type": "info", # info, playing, preview
-        "has_artwork": False,
-        "artwork_ts": 0
-    },
-    "history": []
-}
-
-# Global Config
-current_config = DEFAULT_CONFIG.copy()
-
-def get_app_dir():
-    """Get the directory where the application is running"""
-    config_dir=appdirs.user_config_dir("DjayNowplaying")
-    Path(config_dir).mkdir(parents=True, exist_ok=True)
-    return config_dir
-    #if getattr(sys, 'frozen', False):
-    #    return os.path.dirname(sys.executable)
-    #return os.path.dirname(os.path.abspath(__file__))
-    
-    
-
-def get_template_content():
-    """Read HTML template, use default if not found"""
-    base_dir = get_app_dir()
-    template_file = current_config.get("template_file", "template.html")
-    #template_path = os.path.join(base_dir, template_file)
-    template_path = Path(base_dir,template_file)
-    if not template_path.exists():
-        default_file=Path(Path(__file__).resolve().parent,"template.html")
-        shutil.copy(default_file,base_dir)
-    try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return """<!DOCTYPE html><html><body><h1>Template not found</h1></body></html>"""
-
-def load_config():
-    """Load configuration from JSON file"""
-    global current_config
-    config_path = os.path.join(get_app_dir(), CONFIG_FILE)
-
-    loaded_config = DEFAULT_CONFIG.copy()
-    
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r') as f:
-                file_config = json.load(f)
-                loaded_config.update(file_config)
-        except:
-            pass
-    else:
-        # Create default config file if it doesn't exist
-        save_config(loaded_config)
-        
-    current_config = loaded_config
-    return current_config
-
-def save_config(config_data):
-    """Save configuration to JSON file"""
-    config_path = os.path.join(get_app_dir(), CONFIG_FILE)
-    try:
-        with open(config_path, 'w') as f:
-            json.dump(config_data, f, indent=4)
-    except:
-        pass
-
-def update_config(key, value):
-    """Update a single config value and save"""
-    global current_config
-    current_config[key] = value
-    save_config(current_config)
-
-def find_available_port(start_port):
-    """Find an available port"""
-    port = start_port
-    while port < 65535:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            if s.connect_ex(('localhost', port)) != 0:
-                return port
-            port += 1
-    return start_port
-
-class ArtworkManager:
-    def __init__(self, db_path):
-        self.db_path = db_path
-        self.path_cache = {} # (artist, title) -> file_path
-        self.load_paths()
-        
-    def load_paths(self):
-        try:
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=1.0)
-            cursor = conn.cursor()
-            cursor.execute("SELECT data FROM database2 WHERE collection='localMediaItemLocations'")
-            rows = cursor.fetchall()
-            conn.close()
-            
-            count = 0
-            for row in rows:
-                res = self.parse_blob_for_path(row[0])
-                if res:
-                    artist, title, path = res
-                    # Normalize keys
-                    key = (artist.strip(), title.strip())
-                    self.path_cache[key] = path
-                    count += 1
-            return count
-        except Exception as e:
-            print(f"Error loading paths: {e}")
-            return 0
-
-    def parse_blob_for_path(self, blob_data):
-        try:
-            # Extract all strings
-            strings = re.findall(b'[a-zA-Z0-9\s_\.\-\(\)\&\'\,\[\]\!\?\\\\\/\:\%\+]+', blob_data)
-            decoded = []
-            for s in strings:
-                try:
-                    d = s.decode('utf-8', errors='ignore').strip()
-                    if len(d) > 1: decoded.append(d)
-                except: pass
-            
-            title = None
-            artist = None
-            file_path = None
-            
-            # Heuristic: Value comes before Key in this specific binary format
-            for i, s in enumerate(decoded):
-                if s == 'title' and i > 0:
-                    title = decoded[i-1]
-                elif s == 'artist' and i > 0:
-                    artist = decoded[i-1]
-                elif s.startswith('file:///') and file_path == None:  #make sure that only one will be taken
-                    file_path = s
-            
-            if title and artist and file_path:
-                # Decode URL
-                path = urllib.parse.unquote(file_path)
-                if path.startswith('file:///'):
-                    if sys.platform=="win32": #for windows users 
-                        path = path[8:] # Remove file:///
-                        path = path.replace('/', '\\')
-                    else:
-                        path = path[7:] # Remove file://
-                return (artist, title, path)
-        except:
-            pass
-        return None
-
-    def extract_artwork(self, artist, title):
-        if not HAS_MUTAGEN:
-            return False
-            
-        key = (artist.strip(), title.strip())
-        path = self.path_cache.get(key)
-        
-        if not path or not os.path.exists(path):
-            # Try refreshing cache once if not found
-            self.load_paths()
-            path = self.path_cache.get(key)
-            if not path or not os.path.exists(path):
-                return False
-        
-        try:
-            f = mutagen.File(path)
-            if not f: return False
-            
-            artwork_data = None
-            
-            # ID3 (MP3)
-            if hasattr(f, 'tags') and f.tags:
-                for tag in f.tags.values():
-                    if hasattr(tag, 'data') and hasattr(tag, 'mime'):
-                        if tag.mime.startswith('image/'):
-                            artwork_data = tag.data
-                            break
-            
-            # FLAC / Vorbis
-            if not artwork_data and hasattr(f, 'pictures'):
-                if f.pictures:
-                    artwork_data = f.pictures[0].data
-            
-            if artwork_data:
-                cover_path = os.path.join(get_app_dir(), 'current_cover.jpg')
-                with open(cover_path, 'wb') as img:
-                    img.write(artwork_data)
-                return True
-                
-        except Exception as e:
-            print(f"Artwork extraction error: {e}")
-            
-        return False
-
-class RequestHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            content = get_template_content()
-            self.wfile.write(content.encode('utf-8'))
-        elif self.path == '/api/now_playing':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            # Construct response with settings
-            response = server_state.copy()
-            response['settings'] = {
-                'show_history': current_config.get('show_history', True),
-                'show_history_time': current_config.get('show_history_time', True),
-                'show_source': current_config.get('show_source', True)
-            }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
-        elif self.path.startswith('/cover.jpg'):
-            cover_path = os.path.join(get_app_dir(), 'current_cover.jpg')
-            if os.path.exists(cover_path):
-                self.send_response(200)
-                self.send_header('Content-type', 'image/jpeg')
-                self.end_headers()
-                with open(cover_path, 'rb') as f:
-                    self.wfile.write(f.read())
-            else:
-                self.send_error(404)
-        else:
-            self.send_error(404)
-    
-    def log_message(self, format, *args):
-        pass # Disable HTTP request logging
-
-class PlaybackMonitor(threading.Thread):
-    def __init__(self, db_path, log_callback):
-        super().__init__()
-        self.daemon = True
-        self.db_path = db_path
-        self.log_callback = log_callback
-        self.artwork_manager = ArtworkManager(db_path)
-        self.last_snapshot = {}
-        self.recent_tracks = []
-        self.target_collections = [
-            'historySessionItems'
-        ]
-        self.poll_interval = current_config.get("poll_interval", 0.5)
-
-    def parse_blob(self, blob_data):
-        try:
-            strings = re.findall(b'[a-zA-Z0-9\s_\.\-\(\)\&\'\,\[\]\!\?]+', blob_data)
-            decoded = []
-            for s in strings:
-                try:
-                    d = s.decode('utf-8', errors='ignore').strip()
-                    if len(d) > 1: decoded.append(d)
-                except: pass
-            
-            title = "Unknown"
-            artist = "Unknown"
-            source = "Unknown"
-            
-            # Heuristic: Value comes before Key
-            for i, s in enumerate(decoded):
-                if s == 'title' and i > 0:
-                    title = decoded[i-1]
-                elif s == 'artist' and i > 0:
-                    artist = decoded[i-1]
-                elif s == 'originSourceID' and i > 0:
-                    source = decoded[i-1]
-                
-            if title == "Unknown" and artist == "Unknown": return None
-            return {"artist": artist, "title": title, "source": source}
-        except:
-            return None
-
-    def get_snapshot(self):
-        snapshot = {}
-        try:
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=1.0)
-            cursor = conn.cursor()
-            placeholders = ','.join(['?'] * len(self.target_collections))
-            query = f"SELECT rowid, collection, data FROM database2 WHERE collection IN ({placeholders})"
-            cursor.execute(query, self.target_collections)
-            rows = cursor.fetchall()
-            conn.close()
-            for r in rows:
-                snapshot[r[0]] = {'collection': r[1], 'data': r[2]}
-            return snapshot, None
-        except Exception as e:
-            return None, str(e)
-
-    def is_duplicate(self, track_str):
-        now = time.time()
-        self.recent_tracks = [t for t in self.recent_tracks if now - t[1] < 5.0]
-        for track, timestamp in self.recent_tracks:
-            if track == track_str: return True
-        self.recent_tracks.append((track_str, now))
-        return False
-
-    def run(self):
-        self.log_callback("Monitor thread started...")
-        self.log_callback(f"Loaded {len(self.artwork_manager.path_cache)} file paths for artwork.")
-        
-        self.last_snapshot, _ = self.get_snapshot()
-        if not self.last_snapshot: self.last_snapshot = {}
-
-        while True:
-            time.sleep(self.poll_interval)
-            current_snapshot, err = self.get_snapshot()
-            if err:
-                # self.log_callback(f"DB Error: {err}") # Optional: log errors
-                continue
-            
-            if not current_snapshot: continue
-
-            for rowid, info in current_snapshot.items():
-                if rowid not in self.last_snapshot:
-                    track_data = self.parse_blob(info['data'])
-                    if track_data:
-                        track_str = f"{track_data['artist']} - {track_data['title']}"
-                        if not self.is_duplicate(track_str):
-                            timestamp = datetime.datetime.now().strftime('%H:%M:%S')
-                            
-                            # Extract Artwork
-                            has_artwork = self.artwork_manager.extract_artwork(track_data['artist'], track_data['title'])
-                            
-                            raw_source = track_data.get('source', 'Unknown')
-                            display_source = raw_source
-                            
-                            # Logic: Hide 'explorer' always.
-                            if str(raw_source).lower() == 'explorer':
-                                display_source = None
-                            else:
-                                display_source = raw_source
-                            
-                            new_track = {
-                                "artist": track_data['artist'],
-                                "title": track_data['title'],
-                                "source": display_source,
-                                "status": "Playing",
-                                "timestamp": timestamp,
-                                "type": "playing",
-                                "has_artwork": has_artwork,
-                                "artwork_ts": int(time.time())
-                            }
-                            
-                            server_state['current'] = new_track
-                            
-                            history_item = new_track.copy()
-                            server_state['history'].insert(0, history_item)
-                            if len(server_state['history']) > 10:
-                                server_state['history'].pop()
-                                
-                            self.log_callback(f"[{timestamp}] Detected: {track_str} (ON AIR) [Source: {raw_source}] [Art: {'Yes' if has_artwork else 'No'}]")
-
-            self.last_snapshot = current_snapshot
-
-class MonitorGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("DjayNowplaying")
-        self.root.geometry("600x450")
-        
-        # Load Config
-        load_config()
-        
-        # Resolve DB Path
-        self.db_path = self.resolve_db_path()
-        if not self.db_path:
-            # If user cancelled or failed to pick, we can't proceed.
-            # We schedule destroy to happen after init returns
-            self.root.after(100, self.root.destroy)
-            return
-
-        # Status Frame
-        status_frame = tk.Frame(root, pady=10)
-        status_frame.pack(fill=tk.X, padx=10)
-        
-        # Determine Port
-        config_port = current_config.get("port", 8000)
-        self.port = find_available_port(config_port)
-        self.url = f"http://localhost:{self.port}"
-        
-        tk.Label(status_frame, text="Server Status:", font=("Arial", 10, "bold")).pack(side=tk.LEFT)
-        tk.Label(status_frame, text="Running", fg="green").pack(side=tk.LEFT, padx=5)
-        
-        # DB Path Display
-        db_frame = tk.Frame(root, pady=2)
-        db_frame.pack(fill=tk.X, padx=10)
-        tk.Label(db_frame, text="Database:", font=("Arial", 9, "bold")).pack(side=tk.LEFT)
-        tk.Label(db_frame, text=os.path.basename(self.db_path), fg="#555").pack(side=tk.LEFT, padx=5)
-        
-        # URL Frame
-        url_frame = tk.Frame(root, pady=5)
-        url_frame.pack(fill=tk.X, padx=10)
-        
-        tk.Label(url_frame, text="Monitor URL:").pack(side=tk.LEFT)
-        url_link = tk.Label(url_frame, text=self.url, fg="blue", cursor="hand2")
-        url_link.pack(side=tk.LEFT, padx=5)
-        url_link.bind("<Button-1>", lambda e: webbrowser.open(self.url))
-        
-        tk.Button(url_frame, text="Settings", command=self.open_settings).pack(side=tk.RIGHT, padx=5)
-        tk.Button(url_frame, text="Open Browser", command=lambda: webbrowser.open(self.url)).pack(side=tk.RIGHT)
-
-        # Log Area
-        tk.Label(root, text="Activity Log:", anchor="w").pack(fill=tk.X, padx=10, pady=(10,0))
-        self.log_area = scrolledtext.ScrolledText(root, height=15)
-        self.log_area.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-        
-        if not HAS_MUTAGEN:
-            self.log("Warning: 'mutagen' library not found. Artwork extraction disabled.")
-            self.log("Run 'pip install mutagen' to enable artwork support.")
-        
-        # Start Threads
-        self.start_threads()
-
-    def open_settings(self):
-        # Reload config to ensure freshness
-        load_config()
-        
-        settings_win = tk.Toplevel(self.root)
-        settings_win.title("Settings")
-        settings_win.geometry("400x400")
-        
-        # DB Path
-        tk.Label(settings_win, text="Database Path:").pack(anchor="w", padx=10, pady=(10, 0))
-        db_frame = tk.Frame(settings_win)
-        db_frame.pack(fill=tk.X, padx=10, pady=5)
-        
-        db_var = tk.StringVar(master=settings_win, value=current_config.get("db_path", ""))
-        tk.Entry(db_frame, textvariable=db_var).pack(side=tk.LEFT, fill=tk.X, expand=True)
-        
-        def browse_db():
-            path = filedialog.askopenfilename(
-                parent=settings_win,
-                title="Select MediaLibrary.db",
-                filetypes=[("SQLite Database", "*.db"), ("All Files", "*.*")]
-            )
-            if path: db_var.set(path)
-            
-        tk.Button(db_frame, text="Browse", command=browse_db).pack(side=tk.RIGHT, padx=(5, 0))
-        
-        # Port
-        tk.Label(settings_win, text="Web Server Port (Requires Restart):").pack(anchor="w", padx=10, pady=(10, 0))
-        port_var = tk.IntVar(master=settings_win, value=current_config.get("port", 8000))
-        tk.Entry(settings_win, textvariable=port_var).pack(fill=tk.X, padx=10, pady=5)
-        
-        # Poll Interval
-        tk.Label(settings_win, text="Poll Interval (seconds):").pack(anchor="w", padx=10, pady=(10, 0))
-        poll_var = tk.DoubleVar(master=settings_win, value=current_config.get("poll_interval", 0.5))
-        tk.Entry(settings_win, textvariable=poll_var).pack(fill=tk.X, padx=10, pady=5)
-        
-        # Show Source
-        show_source_var = tk.BooleanVar(master=settings_win, value=bool(current_config.get("show_source", True)))
-        tk.Checkbutton(settings_win, text="Show Streaming Service Name", variable=show_source_var).pack(anchor="w", padx=10, pady=2)
-
-        # Show History
-        show_history_var = tk.BooleanVar(master=settings_win, value=bool(current_config.get("show_history", True)))
-        tk.Checkbutton(settings_win, text="Show History Section", variable=show_history_var).pack(anchor="w", padx=10, pady=2)
-
-        # Show History Time
-        show_history_time_var = tk.BooleanVar(master=settings_win, value=bool(current_config.get("show_history_time", True)))
-        tk.Checkbutton(settings_win, text="Show History Timestamps", variable=show_history_time_var).pack(anchor="w", padx=10, pady=2)
-
-        # Save Button
-        def save():
-            try:
-                new_db = db_var.get()
-                new_port = port_var.get()
-                new_poll = poll_var.get()
-                new_show_source = show_source_var.get()
-                new_show_history = show_history_var.get()
-                new_show_history_time = show_history_time_var.get()
-                
-                if not new_db:
-                    messagebox.showerror("Error", "Database path cannot be empty.", parent=settings_win)
-                    return
-
-                if not os.path.exists(new_db):
-                    messagebox.showerror("Error", "Database file does not exist.", parent=settings_win)
-                    return
-                
-                # Update global config directly and save once
-                global current_config
-                current_config["db_path"] = new_db
-                current_config["port"] = new_port
-                current_config["poll_interval"] = new_poll
-                current_config["show_source"] = bool(new_show_source)
-                current_config["show_history"] = bool(new_show_history)
-                current_config["show_history_time"] = bool(new_show_history_time)
-                
-                save_config(current_config)
-                
-                # Update runtime values where possible
-                if hasattr(self, 'monitor'):
-                    self.monitor.poll_interval = new_poll
-                
-                messagebox.showinfo("Saved", "Settings saved.\nRestart application for Port changes to take effect.", parent=settings_win)
-                settings_win.destroy()
-            except Exception as e:
-                messagebox.showerror("Error", f"Invalid values: {e}", parent=settings_win)
-
-        tk.Button(settings_win, text="Save Settings", command=save, bg="#e1e1e1", height=4).pack(pady=20, fill=tk.X, padx=20)
-
-    def resolve_db_path(self):
-        # 1. Check config
-        path = current_config.get("db_path")
-        if path and os.path.exists(path):
-            return path
-        
-        # 2. Check default location
-        user_profile = None
-        default_path = None
-        if sys.platform=="darwin": #for macOS users 
-            user_profile = os.environ.get('HOME')
-            default_path = os.path.join(user_profile, 'Music', 'djay', 'djay Media Library.djayMediaLibrary', 'MediaLibrary.db')
-        else: 
-            user_profile = os.environ.get('USERPROFILE')
-            default_path = os.path.join(user_profile, 'Music', 'djay', 'djay Media Library', 'MediaLibrary.db')
-        if user_profile:
-            if os.path.exists(default_path):
-                update_config("db_path", default_path)
-                return default_path
-        
-        # 3. Ask user
-        messagebox.showinfo(
-            "Database Not Found", 
-            "Could not automatically find 'MediaLibrary.db'.\n\n"
-            "Please locate it manually.\n"
-            "Typical location: Music -> djay -> djay Media Library"
-        )
-        
-        initial_dir = os.path.join(user_profile, 'Music') if user_profile else "/"
-        selected_path = filedialog.askopenfilename(
-            title="Select MediaLibrary.db",
-            filetypes=[("SQLite Database", "*.db"), ("All Files", "*.*")],
-            initialdir=initial_dir
-        )
-        
-        if selected_path:
-            update_config("db_path", selected_path)
-            return selected_path
-            
-        return None
-
-    def log(self, message):
-        self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)
-
-    def start_threads(self):
-        # Start Monitor
-        self.monitor = PlaybackMonitor(self.db_path, self.log_callback_safe)
-        self.monitor.start()
-        
-        # Start Server
-        self.server_thread = threading.Thread(target=self.run_server, daemon=True)
-        self.server_thread.start()
-        
-        self.log(f"Server started on port {self.port}")
-        self.log(f"Monitoring database: {self.db_path}")
-
-    def log_callback_safe(self, message):
-        # Ensure thread safety for GUI updates
-        self.root.after(0, lambda: self.log(message))
-
-    def run_server(self):
-        server_address = ('', self.port)
-        httpd = HTTPServer(server_address, RequestHandler)
-        try:
-            httpd.serve_forever()
-        except Exception as e:
-            self.log_callback_safe(f"Server Error: {e}")
-
-def main():
-    root = tk.Tk()
-    app = MonitorGUI(root)
-    root.mainloop()
-
-if __name__ == "__main__":
-    main()
+# Nowplaying Monitor for djay by Algoriddim
+# Author: stanzas
+# Added: 2025-12-31
+# copyright (c) 2025-2026 stanzas
+# License: MIT
+# version 1.1
+import sqlite3
+import time
+import os
+import re
+import datetime
+import json
+import zlib
+import gzip
+import hashlib
+import collections
+import bisect
+import unicodedata
+import threading
+import queue
+import csv
+import io
+import concurrent.futures
+import socket
+import sys
+import webbrowser
+import urllib.parse
+import urllib.request
+import base64
+import binascii
+import hmac
+import email.utils
+import shutil
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+import logging
+import logging.handlers
+import signal
+import importlib
+import importlib.util
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import appdirs
+from pathlib import Path
+
+# Optional packages are only looked up here and imported on first use:
+# mutagen extracts artwork, Pillow (PIL) scales it down to thumbnails
+HAS_MUTAGEN = importlib.util.find_spec("mutagen") is not None
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+# ================= Configuration =================
+CONFIG_FILE = "config.json"
+DEFAULT_CONFIG = {
+    "db_path": None,
+    "poll_interval": 0.5,
+    "adaptive_polling": True, # Poll faster around track changes, slower while idle
+    "poll_min_interval": 0.2,
+    "poll_max_interval": 2.0,
+    "port": 8000,
+    "template_file": "template.html",
+    "show_source": True,
+    "show_history": True,
+    "show_history_time": True,
+    "detection_mode": "poll", # poll, events (wake on DB file changes)
+    "event_fallback_interval": 5.0,
+    "artwork_cache_mb": 200,
+    "artwork_workers": 2,
+    "thumbnail_sizes": [160, 320, 640], # Sizes served for ?size= (needs Pillow); empty to always send originals
+    "max_clients": 64,
+    "client_timeout": 30,
+    "save_history": True,
+    "dedup_window": 5.0,
+    "log_lines": 1000, # Lines kept in the window's activity log; the log file keeps everything
+    "debug_timings": False, # Log per-stage timings for every detection
+    "sources": [], # Extra databases: [{"name": ..., "db_path": ..., "channel": ...}]
+    "ingest_token": "", # Accept detections from remote agents on /api/ingest (off while empty)
+    "push_url": "", # Agent mode: also send detections to another server's /api/ingest
+    "push_token": "",
+    "push_channel": "main",
+    "sinks": [] # Outputs: [{"type": "webhook"|"udp"|"file", "channel": ..., ...}]
+}
+# ===========================================
+
+# Global State
+# Each channel (room/booth) holds an immutable snapshot: writers build a new one and
+# swap the reference, so readers never lock and never see current and history out
+# of step. The dicts inside a published snapshot are never modified again.
+# origin_source: raw originSourceID of the current track, which current["source"] hides for explorer
+NowPlayingState = collections.namedtuple('NowPlayingState', ['current', 'history', 'origin_source'],
+                                         defaults=(None,))
+HISTORY_SIZE = 10
+DEFAULT_CHANNEL = "main"
+MAX_CHANNELS = 64
+CHANNEL_NAME_RE = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+INITIAL_TRACK = {
+    "artist": "-",
+    "title": "Waiting for playback...",
+    "status": "Ready",
+    "timestamp": "",
+    "type": "info", # info, playing, preview
+    "has_artwork": False,
+    "artwork_id": None,
+    "artwork_url": None,
+    "artwork_ts": 0
+}
+
+# Global Config
+current_config = DEFAULT_CONFIG.copy()
+config_overrides = {} # Command line values; they win over config.json, also after a reload
+config_stat = None # (mtime, size) of config.json when it was last read or written
+
+app_dir = None
+
+def get_app_dir():
+    """Get the directory where the application is running"""
+    global app_dir
+    if app_dir is None:
+        config_dir=appdirs.user_config_dir("DjayNowplaying")
+        Path(config_dir).mkdir(parents=True, exist_ok=True)
+        app_dir = config_dir
+    return app_dir
+    #if getattr(sys, 'frozen', False):
+    #    return os.path.dirname(sys.executable)
+    #return os.path.dirname(os.path.abspath(__file__))
+    
+    
+
+StaticAsset = collections.namedtuple('StaticAsset', ['body', 'gzip_body', 'etag', 'last_modified', 'content_type'])
+
+def make_static_asset(body, content_type, mtime=None):
+    return StaticAsset(body, gzip.compress(body), '"%s"' % hashlib.sha1(body).hexdigest()[:20],
+                       email.utils.formatdate(mtime, usegmt=True) if mtime else None, content_type)
+
+class CachedFile:
+    """A file kept in memory (with a gzip copy), re-read only when its stat() changes"""
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self.stat_key = None
+        self.asset = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """Current contents as a StaticAsset, or None if the file is gone"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            if key != self.stat_key:
+                try:
+                    with open(self.path, 'rb') as f:
+                        body = f.read()
+                except OSError:
+                    return None
+                self.asset = make_static_asset(body, self.content_type, st.st_mtime)
+                self.stat_key = key
+            return self.asset
+
+static_files = {} # path -> CachedFile
+TEMPLATE_NOT_FOUND = make_static_asset(b"<!DOCTYPE html><html><body><h1>Template not found</h1></body></html>",
+                                       'text/html; charset=utf-8')
+
+def get_template_asset():
+    """HTML template from the app dir, served from memory; the default is copied there if missing"""
+    base_dir = get_app_dir()
+    template_file = current_config.get("template_file", "template.html")
+    template_path = os.path.join(base_dir, template_file)
+    cached = static_files.get(template_path)
+    if cached is None:
+        cached = static_files.setdefault(template_path, CachedFile(template_path, 'text/html; charset=utf-8'))
+    asset = cached.get()
+    if asset is None:
+        try:
+            default_file=Path(Path(__file__).resolve().parent,"template.html")
+            shutil.copy(default_file,base_dir)
+        except OSError:
+            pass
+        asset = cached.get()
+    return asset or TEMPLATE_NOT_FOUND
+
+def get_config_stat(config_path):
+    try:
+        st = os.stat(config_path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def load_config():
+    """Load configuration from JSON file; the file is only re-read when it changed"""
+    global current_config, config_stat
+    config_path = os.path.join(get_app_dir(), CONFIG_FILE)
+    stat = get_config_stat(config_path)
+    if stat is not None and stat == config_stat:
+        return current_config
+
+    loaded_config = DEFAULT_CONFIG.copy()
+    
+    if stat is not None:
+        try:
+            with open(config_path, 'r') as f:
+                file_config = json.load(f)
+                loaded_config.update(file_config)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {config_path}: {e}")
+            if config_stat is not None:
+                # Keep the running config (e.g. the file is half-written); retry when it changes again
+                config_stat = stat
+                return current_config
+    else:
+        # Create default config file if it doesn't exist
+        save_config(loaded_config)
+        
+    loaded_config.update(config_overrides)
+    current_config = loaded_config
+    config_stat = stat or get_config_stat(config_path)
+    return current_config
+
+def save_config(config_data):
+    """Save configuration to JSON file"""
+    global config_stat
+    config_path = os.path.join(get_app_dir(), CONFIG_FILE)
+    try:
+        with open(config_path, 'w') as f:
+            json.dump(config_data, f, indent=4)
+        config_stat = get_config_stat(config_path) # Our own write is not an external edit
+    except:
+        pass
+
+def update_config(key, value):
+    """Update a single config value and save"""
+    global current_config
+    current_config[key] = value
+    save_config(current_config)
+
+def get_user_profile():
+    return os.environ.get('HOME') if sys.platform == "darwin" else os.environ.get('USERPROFILE')
+
+def find_db_path(remember=True):
+    """MediaLibrary.db from the config, else djay's default location; None if neither exists"""
+    # 1. Check config
+    path = current_config.get("db_path")
+    if path and os.path.exists(path):
+        return path
+    
+    # 2. Check default location
+    user_profile = get_user_profile()
+    if not user_profile:
+        return None
+    if sys.platform=="darwin": #for macOS users 
+        default_path = os.path.join(user_profile, 'Music', 'djay', 'djay Media Library.djayMediaLibrary', 'MediaLibrary.db')
+    else: 
+        default_path = os.path.join(user_profile, 'Music', 'djay', 'djay Media Library', 'MediaLibrary.db')
+    if os.path.exists(default_path):
+        if remember:
+            update_config("db_path", default_path)
+        return default_path
+    return None
+
+def find_available_port(start_port):
+    """Find an available port"""
+    port = start_port
+    while port < 65535:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            if s.connect_ex(('localhost', port)) != 0:
+                return port
+            port += 1
+    return start_port
+
+# ================= Metrics =================
+# Observing a value is a bisect and two additions; the Prometheus text is only
+# built when /metrics is scraped.
+TIMING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Cumulative histogram of durations in seconds, optionally split by one label"""
+    def __init__(self, name, help_text, label=None, buckets=TIMING_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {} # label value -> [count per bucket (+Inf last), sum]
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, label_value=None):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = [(value, list(counts), total) for value, (counts, total) in self.series.items()]
+        for value, counts, total in sorted(series, key=lambda s: str(s[0])):
+            labels = f'{self.label}="{value}",' if self.label else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            labels = "{" + labels.rstrip(",") + "}" if labels else ""
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Histograms plus counters/gauges that are read from their owners at scrape time"""
+    def __init__(self):
+        self.histograms = {}
+        self.values = {} # name -> (type, help, fn); registering a name again replaces it
+
+    def histogram(self, name, help_text, label=None):
+        self.histograms[name] = Histogram(name, help_text, label)
+        return self.histograms[name]
+
+    def counter(self, name, help_text, fn):
+        self.values[name] = ("counter", help_text, fn)
+
+    def gauge(self, name, help_text, fn):
+        self.values[name] = ("gauge", help_text, fn)
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, fn) in list(self.values.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        for histogram in list(self.histograms.values()):
+            lines += histogram.render()
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+metrics = MetricsRegistry()
+DB_QUERY_SECONDS = metrics.histogram("djay_nowplaying_db_query_seconds",
+                                     "Time spent reading new rows from MediaLibrary.db, per poll that found a change")
+PARSE_SECONDS = metrics.histogram("djay_nowplaying_parse_seconds", "Time to decode one history blob")
+ARTWORK_SECONDS = metrics.histogram("djay_nowplaying_artwork_seconds", "Time to find and extract artwork for a track")
+PUBLISH_SECONDS = metrics.histogram("djay_nowplaying_detect_to_publish_seconds",
+                                    "Time from reading a new history row to publishing it to clients")
+THUMBNAIL_SECONDS = metrics.histogram("djay_nowplaying_thumbnail_seconds",
+                                      "Time to decode artwork and encode its thumbnails")
+HTTP_REQUEST_SECONDS = metrics.histogram("djay_nowplaying_http_request_seconds",
+                                         "HTTP request latency (streams and long-polls excluded)", label="route")
+
+# ================= Blob Decoding =================
+# djay records are binary blobs in which every string value is stored right
+# before its key ("<value>\0title\0"). Strings are the runs between control
+# bytes; high bytes are kept so non-ASCII titles come through intact.
+BLOB_STRING_RE = re.compile(rb'[^\x00-\x1f\x7f]+')
+# When a value is empty, the string before its key is the blob magic or the previous
+# key; neither is ever taken as a value
+BLOB_KEYS = frozenset((b'TSAF', b'title', b'artist', b'originSourceID', b'deckNumber'))
+
+TrackRecord = collections.namedtuple('TrackRecord', ['artist', 'title', 'source', 'path', 'deck'], defaults=(None,))
+
+def decode_blob(blob_data, want_source=False, want_path=False, want_deck=False):
+    """Single pass over the strings of a djay blob.
+    Stops as soon as every requested field is found; missing fields are None."""
+    artist = title = source = path = deck = None
+    needed = 2 + want_source + want_path + want_deck
+    found = 0
+    previous = None
+    for match in BLOB_STRING_RE.finditer(blob_data):
+        s = match.group().strip()
+        if not s:
+            continue
+        if previous is not None and previous not in BLOB_KEYS:
+            if s == b'title' and title is None:
+                title = previous.decode('utf-8', errors='ignore')
+                found += 1
+            elif s == b'artist' and artist is None:
+                artist = previous.decode('utf-8', errors='ignore')
+                found += 1
+            elif s == b'originSourceID' and want_source and source is None:
+                source = previous.decode('utf-8', errors='ignore')
+                found += 1
+            elif s == b'deckNumber' and want_deck and deck is None:
+                deck = previous.decode('utf-8', errors='ignore')
+                found += 1
+        if want_path and path is None and s.startswith(b'file:///'):
+            path = s.decode('utf-8', errors='ignore')
+            found += 1
+        if found == needed:
+            break
+        previous = s
+    return TrackRecord(artist, title, source, path, deck)
+
+def normalize_text(text):
+    """Fold case, Unicode composition and runs of whitespace for lookups"""
+    return " ".join(unicodedata.normalize('NFKC', text).casefold().split())
+
+def normalize_key(artist, title):
+    return (normalize_text(artist), normalize_text(title))
+
+class RecentTracks:
+    """Time-windowed duplicate filter keyed on normalized artist/title.
+    Expired entries are dropped from the front of the deque, so each check is O(1) amortized.
+    A channel's local monitors and remote agents check it from different threads."""
+    def __init__(self, window=5.0):
+        self.window = window
+        self.order = collections.deque() # (seen_at, key), oldest first
+        self.seen = {} # key -> seen_at, for keys still inside the window
+        self.last_accepted = None # (deck, key) of the most recent accepted track
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, artist, title, deck=None, now=None):
+        if now is None:
+            now = time.monotonic()
+        key = normalize_key(artist or "", title or "")
+        with self.lock:
+            while self.order and now - self.order[0][0] >= self.window:
+                self.seen.pop(self.order.popleft()[1], None)
+            if key in self.seen:
+                return True
+            # The same load re-logged by its deck, with nothing else played since, is not a new play
+            if deck is not None and self.last_accepted == (deck, key):
+                return True
+            self.seen[key] = now
+            self.order.append((now, key))
+            self.last_accepted = (deck, key)
+            return False
+
+# ===========================================
+
+class PollScheduler:
+    """Picks the delay before the next poll from recent playback activity.
+    Polls at min_interval right after a detection and when the next track change is due
+    (judged from the usual gap between tracks); otherwise starts at the base interval and
+    doubles it for every BACKOFF_STEP seconds the DB stays idle, up to max_interval."""
+    FAST_AFTER_DETECTION = 20.0 # Seconds of fast polling after a track is detected
+    TRANSITION_WINDOW = 30.0 # Seconds of fast polling either side of the expected next track
+    MAX_TRACK_GAP = 900.0 # Longer gaps are breaks, not track lengths
+    BACKOFF_STEP = 30.0
+
+    def __init__(self, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.last_activity = time.monotonic() # Last detection or DB write
+        self.last_detection = None
+        self.expected_gap = None # Moving average of seconds between detections
+        self.slept = 0.0
+        self.polls = 0
+
+    def record(self, changed, detected, now):
+        """Feed the result of a poll: did the DB change, was a new track announced"""
+        if detected:
+            if self.last_detection is not None:
+                gap = now - self.last_detection
+                if gap <= self.MAX_TRACK_GAP:
+                    self.expected_gap = gap if self.expected_gap is None else 0.7 * self.expected_gap + 0.3 * gap
+            self.last_detection = now
+        if changed or detected:
+            self.last_activity = now
+
+    def next_interval(self, base, now):
+        interval = min(max(base, self.min_interval), self.max_interval)
+        if self.last_detection is not None:
+            since = now - self.last_detection
+            if since < self.FAST_AFTER_DETECTION:
+                interval = self.min_interval
+            elif self.expected_gap is not None and abs(since - self.expected_gap) < self.TRANSITION_WINDOW:
+                interval = self.min_interval
+        if interval > self.min_interval:
+            # Capped before the power: hours without a DB commit would overflow the float
+            doublings = min((now - self.last_activity) / self.BACKOFF_STEP, 64)
+            interval = min(self.max_interval, interval * 2 ** doublings)
+        self.slept += interval
+        self.polls += 1
+        return interval
+
+    def average_interval(self):
+        """Average delay since the last call, then reset"""
+        average = self.slept / self.polls if self.polls else 0.0
+        self.slept = 0.0
+        self.polls = 0
+        return average
+
+class LibraryConnection:
+    """Long-lived read-only connection to djay's MediaLibrary.db with cheap change detection"""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.RLock()
+        self.db_identity = None # (st_dev, st_ino) of the file we are connected to
+        self.generation = 0 # Bumped whenever the DB file is replaced
+        self.file_state = None
+        self.pending_file_state = None
+        self.data_version = None
+        self.last_version_check = 0
+        self.stats = {"connects": 0, "skips": 0, "queries": 0, "errors": 0}
+
+    def get_db_identity(self):
+        st = os.stat(self.db_path)
+        return (st.st_dev, st.st_ino)
+
+    def get_file_state(self):
+        """mtime/size of the DB and its -wal file; every commit by djay touches one of them"""
+        state = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+                state.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                state.append(None)
+        return tuple(state)
+
+    def connect(self):
+        self.close()
+        identity = self.get_db_identity()
+        self.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=1.0, check_same_thread=False)
+        if self.db_identity is not None and identity != self.db_identity:
+            self.generation += 1
+        self.db_identity = identity
+        self.file_state = None
+        self.pending_file_state = None
+        self.data_version = None
+        self.stats["connects"] += 1
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except sqlite3.Error:
+                pass
+            self.conn = None
+
+    def has_changed(self):
+        """Return True if djay may have committed anything since the last call"""
+        with self.lock:
+            file_state = self.get_file_state()
+            now = time.time()
+            # Trust the stat() result for up to a second, then re-check data_version anyway
+            # in case two commits landed within one mtime tick without changing the size
+            if self.conn is not None and file_state == self.file_state and now - self.last_version_check < 1.0:
+                self.stats["skips"] += 1
+                return False
+            try:
+                if self.conn is None or self.get_db_identity() != self.db_identity:
+                    self.connect()
+                data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            except (sqlite3.Error, OSError):
+                self.stats["errors"] += 1
+                self.close()
+                raise
+            # Only trust a stat result once it was seen on two consecutive checks:
+            # a commit becomes visible slightly after its last -wal write
+            if file_state == self.pending_file_state:
+                self.file_state = file_state
+            self.pending_file_state = file_state
+            self.last_version_check = now
+            if data_version == self.data_version:
+                self.stats["skips"] += 1
+                return False
+            self.data_version = data_version
+            return True
+
+    def execute(self, query, params=()):
+        """Run a query and fetch all rows; the connection is rebuilt on the next call after an error"""
+        with self.lock:
+            try:
+                if self.conn is None:
+                    self.connect()
+                self.stats["queries"] += 1
+                return self.conn.execute(query, params).fetchall()
+            except (sqlite3.Error, OSError):
+                self.stats["errors"] += 1
+                self.close()
+                raise
+
+    def get_row_fingerprint(self, rowid):
+        """CRC of a row's identity (collection and key, unique per djay object), used to notice a rowid
+        that now belongs to a different row. The data is left out: djay updates rows in place."""
+        rows = self.execute("SELECT collection, key FROM database2 WHERE rowid = ?", (rowid,))
+        if not rows:
+            return None
+        collection, key = rows[0]
+        return zlib.crc32(f"{collection}\0{key}".encode('utf-8', errors='surrogatepass'))
+
+class DbChangeWatcher:
+    """Blocks until one of the watched MediaLibrary.db files (or its -wal/-shm) is written.
+    Uses inotify on Linux and watchdog elsewhere (if installed); backend is None if neither works."""
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    def __init__(self, db_paths, debounce=0.02):
+        if isinstance(db_paths, str):
+            db_paths = [db_paths]
+        self.watched = {} # directory -> {file name: db path it belongs to}
+        for db_path in db_paths:
+            names = self.watched.setdefault(os.path.dirname(os.path.abspath(db_path)), {})
+            db_name = os.path.basename(db_path)
+            for suffix in ("", "-wal", "-shm"):
+                names[db_name + suffix] = db_path
+        self.debounce = debounce
+        self.backend = None
+        self.fd = None
+        self.wds = {} # inotify watch descriptor -> directory
+        self.observer = None
+        self.event = threading.Event()
+        self.changed = set() # db paths written since the last wait()
+        self.changed_lock = threading.Lock()
+        self.wake_pipe = None # Lets wake() interrupt a blocking inotify select
+        if sys.platform.startswith("linux"):
+            self.start_inotify()
+        if self.backend is None:
+            self.start_watchdog()
+
+    def start_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return
+            mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            for db_dir in self.watched:
+                wd = libc.inotify_add_watch(fd, db_dir.encode(sys.getfilesystemencoding()), mask)
+                if wd < 0:
+                    os.close(fd)
+                    self.wds = {}
+                    return
+                self.wds[wd] = db_dir
+            self.fd = fd
+            self.wake_pipe = os.pipe()
+            self.backend = "inotify"
+        except (OSError, AttributeError):
+            pass
+
+    def start_watchdog(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for path in (getattr(event, "src_path", ""), getattr(event, "dest_path", "")):
+                    if path:
+                        names = watcher.watched.get(os.path.dirname(os.path.abspath(path)), {})
+                        db_path = names.get(os.path.basename(path))
+                        if db_path:
+                            with watcher.changed_lock:
+                                watcher.changed.add(db_path)
+                            watcher.event.set()
+
+        try:
+            self.observer = Observer()
+            for db_dir in self.watched:
+                self.observer.schedule(Handler(), db_dir, recursive=False)
+            self.observer.daemon = True
+            self.observer.start()
+            self.backend = "watchdog"
+        except Exception:
+            self.observer = None
+
+    def read_inotify(self, timeout):
+        """Return True if a relevant inotify event (or a wake()) arrived within timeout"""
+        readable, _, _ = select.select([self.fd, self.wake_pipe[0]], [], [], timeout)
+        if self.wake_pipe[0] in readable:
+            os.read(self.wake_pipe[0], 512)
+            return True
+        if not readable:
+            return False
+        try:
+            buf = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        offset = 0
+        matched = False
+        while offset + 16 <= len(buf):
+            wd, _, _, name_len = struct.unpack_from("iIII", buf, offset)
+            name = buf[offset + 16:offset + 16 + name_len].rstrip(b"\0").decode(sys.getfilesystemencoding(), "replace")
+            db_path = self.watched.get(self.wds.get(wd), {}).get(name)
+            if db_path:
+                self.changed.add(db_path)
+                matched = True
+            offset += 16 + name_len
+        return matched
+
+    def take_changed(self):
+        with self.changed_lock:
+            changed, self.changed = self.changed, set()
+        return changed
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for a change; returns the set of db paths written (empty on timeout).
+        A burst of writes (djay touches -wal and -shm per commit) is coalesced into one wake-up."""
+        if self.backend == "inotify":
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return self.take_changed()
+                if self.read_inotify(remaining):
+                    break
+            while self.read_inotify(self.debounce):
+                pass
+            return self.take_changed()
+        if self.backend == "watchdog":
+            if not self.event.wait(timeout):
+                return self.take_changed()
+            time.sleep(self.debounce)
+            self.event.clear()
+            return self.take_changed()
+        time.sleep(timeout)
+        return set()
+
+    def wake(self):
+        """Make a pending wait() return now (used on shutdown)"""
+        try:
+            if self.wake_pipe is not None:
+                os.write(self.wake_pipe[1], b"\0")
+        except OSError:
+            pass # Already closed
+        self.event.set()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.wake_pipe is not None:
+            for fd in self.wake_pipe:
+                os.close(fd)
+            self.wake_pipe = None
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+        self.backend = None
+
+class ArtworkStore:
+    """Content-addressed artwork cache: the SHA-1 of the image bytes is its id.
+    Recently used images stay in memory; all of them are kept on disk up to a size cap."""
+    MEMORY_LIMIT = 32 * 1024 * 1024
+    ARTWORK_ID_RE = re.compile(r'^[0-9a-f]{40}(-[0-9]{1,4})?$') # Thumbnails are "<id>-<size>"
+    THUMBNAIL_QUALITY = 85
+    IMAGE_TYPES = [
+        (b'\xff\xd8\xff', 'image/jpeg'),
+        (b'\x89PNG\r\n\x1a\n', 'image/png'),
+        (b'GIF8', 'image/gif'),
+        (b'BM', 'image/bmp'),
+    ]
+
+    def __init__(self):
+        self.cache_dir = None
+        self.memory = collections.OrderedDict() # artwork_id -> image bytes, oldest first
+        self.memory_size = 0
+        self.lock = threading.Lock()
+        self.unscaled = set() # (artwork_id, size) where the original is already small enough
+
+    def get_cache_dir(self):
+        if self.cache_dir is None:
+            self.cache_dir = os.path.join(get_app_dir(), 'artwork')
+            Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        return self.cache_dir
+
+    @classmethod
+    def guess_mime(cls, data):
+        for magic, mime in cls.IMAGE_TYPES:
+            if data.startswith(magic):
+                return mime
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            return 'image/webp'
+        return 'application/octet-stream'
+
+    def remember(self, artwork_id, data):
+        with self.lock:
+            if artwork_id in self.memory:
+                self.memory.move_to_end(artwork_id)
+                return
+            self.memory[artwork_id] = data
+            self.memory_size += len(data)
+            while self.memory_size > self.MEMORY_LIMIT and len(self.memory) > 1:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_size -= len(evicted)
+
+    def put(self, data):
+        """Store image bytes and return their artwork id"""
+        artwork_id = hashlib.sha1(data).hexdigest()
+        self.write(artwork_id, data)
+        return artwork_id
+
+    def write(self, artwork_id, data):
+        file_path = os.path.join(self.get_cache_dir(), artwork_id)
+        if not os.path.exists(file_path):
+            # Write to a temp file first so readers never see a partial image
+            tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+            self.prune_disk()
+        self.remember(artwork_id, data)
+
+    def get(self, artwork_id):
+        """Return the image bytes for an id, or None if unknown"""
+        if not artwork_id or not self.ARTWORK_ID_RE.match(artwork_id):
+            return None
+        with self.lock:
+            data = self.memory.get(artwork_id)
+            if data is not None:
+                self.memory.move_to_end(artwork_id)
+                return data
+        try:
+            with open(os.path.join(self.get_cache_dir(), artwork_id), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self.remember(artwork_id, data)
+        return data
+
+    @staticmethod
+    def pick_size(size):
+        """Smallest configured thumbnail size that covers the requested one; None for originals"""
+        sizes = sorted(int(s) for s in current_config.get("thumbnail_sizes") or [])
+        if not HAS_PIL or not sizes:
+            return None
+        return next((s for s in sizes if s >= size), sizes[-1])
+
+    def get_thumbnail(self, artwork_id, size):
+        """(image id, bytes) of the artwork scaled to fit size x size; the original when Pillow is
+        missing or the image is small already; None if the artwork is unknown"""
+        if not artwork_id:
+            return None
+        size = self.pick_size(size)
+        # Thumbnails of thumbnails are not made; "<id>-<size>" ids get their own bytes back
+        if size is not None and '-' not in artwork_id and (artwork_id, size) not in self.unscaled:
+            thumb_id = f"{artwork_id}-{size}"
+            data = self.get(thumb_id)
+            if data is None:
+                data = self.make_thumbnails(artwork_id, [size]).get(size)
+            if data is not None:
+                return thumb_id, data
+        data = self.get(artwork_id)
+        return (artwork_id, data) if data is not None else None
+
+    def make_thumbnails(self, artwork_id, sizes):
+        """Decode the artwork once and store a thumbnail per size; returns {size: bytes}"""
+        data = self.get(artwork_id)
+        if data is None or not HAS_PIL:
+            return {}
+        start = time.perf_counter()
+        thumbnails = {}
+        try:
+            Image = importlib.import_module("PIL.Image")
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+                largest = max(sizes)
+                if image.format == 'JPEG':
+                    image.draft('RGB', (largest, largest)) # Let the decoder skip detail we'd throw away
+                image.load()
+                has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+                for size in sorted(sizes, reverse=True):
+                    if width <= size and height <= size:
+                        self.unscaled.add((artwork_id, size))
+                        continue
+                    thumbnail = image.copy()
+                    thumbnail.thumbnail((size, size), Image.LANCZOS)
+                    out = io.BytesIO()
+                    if has_alpha:
+                        thumbnail.convert('RGBA').save(out, 'PNG')
+                    else:
+                        thumbnail.convert('RGB').save(out, 'JPEG', quality=self.THUMBNAIL_QUALITY)
+                    if out.tell() >= len(data):
+                        self.unscaled.add((artwork_id, size)) # Re-encoding didn't pay off
+                        continue
+                    thumbnails[size] = out.getvalue()
+                    self.write(f"{artwork_id}-{size}", thumbnails[size])
+        except Exception as e:
+            print(f"Thumbnail error for {artwork_id}: {e}")
+            self.unscaled.update((artwork_id, size) for size in sizes)
+        THUMBNAIL_SECONDS.observe(time.perf_counter() - start)
+        return thumbnails
+
+    def contains(self, artwork_id):
+        with self.lock:
+            if artwork_id in self.memory:
+                return True
+        return os.path.exists(os.path.join(self.get_cache_dir(), artwork_id))
+
+    def prune_disk(self):
+        """Delete the least recently written images until the cache fits its size cap"""
+        limit = float(current_config.get("artwork_cache_mb", 200)) * 1024 * 1024
+        try:
+            entries = [e for e in os.scandir(self.get_cache_dir()) if e.is_file() and self.ARTWORK_ID_RE.match(e.name)]
+            total = sum(e.stat().st_size for e in entries)
+            if total <= limit:
+                return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:-1]: # Never delete the image just written
+                if total <= limit:
+                    break
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+        except OSError as e:
+            print(f"Error pruning artwork cache: {e}")
+
+artwork_store = ArtworkStore()
+
+class ArtworkManager:
+    MISS_REFRESH_INTERVAL = 2.0 # Min seconds between rescans for tracks not in the index
+    FULL_RELOAD_INTERVAL = 300.0 # Min seconds between full reloads for paths that went missing
+
+    INDEX_CACHE_FILE = "artwork_index.json"
+    INDEX_CACHE_VERSION = 2
+    INDEX_SAVE_INTERVAL = 60.0 # Min seconds between saves of an incrementally updated index
+
+    def __init__(self, db_path, library=None, log_callback=None, index_file=None):
+        self.db_path = db_path
+        self.library = library or LibraryConnection(db_path)
+        self.log_callback = log_callback or print
+        self.index_file = index_file or self.INDEX_CACHE_FILE # One per database when monitoring several
+        self.path_cache = {} # normalize_key(artist, title) -> file_path
+        self.last_rowid = 0 # Highest localMediaItemLocations rowid indexed so far
+        self.library_generation = self.library.generation
+        self.last_refresh = 0
+        self.last_full_reload = 0
+        self.index_dirty = False
+        self.last_index_save = time.time()
+        self.artwork_ids = collections.OrderedDict() # normalize_key -> artwork id (None: no artwork)
+        # path_cache and artwork_ids are shared with the monitor thread: self.lock only guards
+        # reading/updating them, scan_lock serializes the slow DB rescans and index saves
+        self.lock = threading.Lock()
+        self.scan_lock = threading.Lock()
+
+        start = time.perf_counter()
+        if self.load_index_cache():
+            cached = len(self.path_cache)
+            added = self.load_paths()
+            elapsed = (time.perf_counter() - start) * 1000
+            self.log_callback(f"Artwork index: warm start, {cached} cached + {added} new paths in {elapsed:.0f} ms")
+        else:
+            self.load_paths(full=True)
+            elapsed = (time.perf_counter() - start) * 1000
+            self.log_callback(f"Artwork index: cold start, {len(self.path_cache)} paths in {elapsed:.0f} ms")
+
+    def get_index_cache_path(self):
+        return os.path.join(get_app_dir(), self.index_file)
+
+    def load_index_cache(self):
+        """Restore the index saved by a previous run; False if it is missing or belongs to another DB state"""
+        try:
+            with open(self.get_index_cache_path(), 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if (cache.get("version") != self.INDEX_CACHE_VERSION
+                    or cache.get("db_path") != os.path.abspath(self.db_path)
+                    or tuple(cache.get("db_identity") or ()) != self.library.get_db_identity()):
+                return False
+            last_rowid = cache["last_rowid"]
+            # Same file but rebuilt in place: the row at our watermark is no longer the one we indexed
+            if last_rowid and self.library.get_row_fingerprint(last_rowid) != cache.get("last_rowid_crc"):
+                return False
+            self.path_cache = {(artist, title): path for artist, title, path in cache["paths"]}
+            self.last_rowid = last_rowid
+            return True
+        except (OSError, ValueError, KeyError, TypeError, sqlite3.Error):
+            return False
+
+    def save_index_cache(self):
+        cache_path = self.get_index_cache_path()
+        try:
+            cache = {
+                "version": self.INDEX_CACHE_VERSION,
+                "db_path": os.path.abspath(self.db_path),
+                "db_identity": list(self.library.get_db_identity()),
+                "last_rowid": self.last_rowid,
+                "last_rowid_crc": self.library.get_row_fingerprint(self.last_rowid) if self.last_rowid else None,
+            }
+            with self.lock:
+                cache["paths"] = [[artist, title, path] for (artist, title), path in self.path_cache.items()]
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(cache, ensure_ascii=False, separators=(',', ':')))
+            os.replace(tmp_path, cache_path)
+            self.index_dirty = False
+            self.last_index_save = time.time()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error saving artwork index: {e}")
+        
+    def load_paths(self, full=False):
+        """Index location rows added since the last load, or every row if full is set.
+        Returns the number of paths added. Callers other than __init__ hold scan_lock."""
+        try:
+            now = time.time()
+            self.last_refresh = now
+            if not full:
+                max_rowid = self.library.execute("SELECT MAX(rowid) FROM database2")[0][0] or 0
+                if self.library.generation != self.library_generation or max_rowid < self.last_rowid:
+                    # DB replaced or rebuilt: rowids no longer line up with our watermark
+                    full = True
+            if full:
+                self.last_full_reload = now
+                self.library_generation = self.library.generation
+                last_rowid = 0
+                rows = self.library.execute(
+                    "SELECT rowid, data FROM database2 WHERE collection='localMediaItemLocations'")
+            else:
+                last_rowid = self.last_rowid
+                # "+collection" keeps SQLite on the rowid range instead of the collection index
+                rows = self.library.execute(
+                    "SELECT rowid, data FROM database2 WHERE rowid > ? AND +collection='localMediaItemLocations'",
+                    (last_rowid,))
+            
+            # Decode without the lock; lookups only wait for the dict update itself
+            paths = {}
+            for rowid, data in rows:
+                if rowid > last_rowid:
+                    last_rowid = rowid
+                res = self.parse_blob_for_path(data)
+                if res:
+                    paths[normalize_key(res.artist, res.title)] = res.path
+            count = len(paths)
+            with self.lock:
+                if full:
+                    self.path_cache = paths
+                else:
+                    self.path_cache.update(paths)
+                self.last_rowid = last_rowid
+            if count:
+                self.index_dirty = True
+            # Full rebuilds are saved right away; small deltas are batched, since a
+            # stale cache only costs the next start one incremental query
+            if full or (self.index_dirty and now - self.last_index_save >= self.INDEX_SAVE_INTERVAL):
+                self.save_index_cache()
+            return count
+        except Exception as e:
+            print(f"Error loading paths: {e}")
+            return 0
+
+    def lookup_path(self, artist, title):
+        """Indexed file path for a track, without touching the DB or the disk"""
+        with self.lock:
+            return self.path_cache.get(normalize_key(artist, title))
+
+    def find_path(self, artist, title):
+        """Look up the local file for a track, rescanning the library at a limited rate.
+        Runs on an artwork worker; the monitor's lookups are never blocked by the rescans."""
+        path = self.lookup_path(artist, title)
+        if path is None:
+            # Streaming tracks never have a local file, so only look for newly added rows
+            with self.scan_lock:
+                if time.time() - self.last_refresh >= self.MISS_REFRESH_INTERVAL:
+                    self.load_paths()
+            path = self.lookup_path(artist, title)
+        elif not os.path.exists(path):
+            # Indexed but gone from disk: the file may have been moved and its row updated in place
+            with self.scan_lock:
+                if time.time() - self.last_full_reload >= self.FULL_RELOAD_INTERVAL:
+                    self.load_paths(full=True)
+            path = self.lookup_path(artist, title)
+        if not path or not os.path.exists(path):
+            return None
+        return path
+
+    def parse_blob_for_path(self, blob_data):
+        try:
+            record = decode_blob(blob_data, want_path=True)
+            if record.title and record.artist and record.path:
+                # Decode URL
+                path = urllib.parse.unquote(record.path)
+                if path.startswith('file:///'):
+                    if sys.platform=="win32": #for windows users 
+                        path = path[8:] # Remove file:///
+                        path = path.replace('/', '\\')
+                    else:
+                        path = path[7:] # Remove file://
+                return record._replace(path=path)
+        except:
+            pass
+        return None
+
+    def lookup_cached(self, artist, title):
+        """Return (True, artwork_id) if the track's artwork is already known, else (False, None)"""
+        key = normalize_key(artist, title)
+        with self.lock:
+            if key in self.artwork_ids:
+                artwork_id = self.artwork_ids[key]
+                if artwork_id is None or artwork_store.contains(artwork_id):
+                    self.artwork_ids.move_to_end(key)
+                    return True, artwork_id
+        return False, None
+
+    def extract_artwork(self, artist, title):
+        """Return the artwork id for a track, or None if it has no embedded artwork"""
+        if not HAS_MUTAGEN:
+            return None
+
+        # Replayed tracks skip the file entirely
+        cached, artwork_id = self.lookup_cached(artist, title)
+        if cached:
+            return artwork_id
+            
+        path = self.find_path(artist, title)
+        if not path:
+            return None
+        
+        artwork_id = None
+        try:
+            f = importlib.import_module("mutagen").File(path)
+            if not f: return None
+            
+            artwork_data = None
+            
+            # ID3 (MP3)
+            if hasattr(f, 'tags') and f.tags:
+                for tag in f.tags.values():
+                    if hasattr(tag, 'data') and hasattr(tag, 'mime'):
+                        if tag.mime.startswith('image/'):
+                            artwork_data = tag.data
+                            break
+            
+            # FLAC / Vorbis
+            if not artwork_data and hasattr(f, 'pictures'):
+                if f.pictures:
+                    artwork_data = f.pictures[0].data
+            
+            if artwork_data:
+                artwork_id = artwork_store.put(artwork_data)
+                
+        except Exception as e:
+            print(f"Artwork extraction error: {e}")
+            return None
+
+        with self.lock:
+            self.artwork_ids[normalize_key(artist, title)] = artwork_id
+            if len(self.artwork_ids) > 1000:
+                self.artwork_ids.popitem(last=False)
+        return artwork_id
+
+class PlayHistoryStore:
+    """Append-only log of every detected play in history.db.
+    record() only queues; a writer thread inserts in batches so detection never waits on disk."""
+    BATCH_DELAY = 0.5 # Seconds to collect more plays before committing
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS plays (
+            id INTEGER PRIMARY KEY,
+            played_at REAL NOT NULL,
+            artist TEXT,
+            title TEXT,
+            source TEXT,
+            path TEXT,
+            artwork_id TEXT,
+            channel TEXT
+        );
+        CREATE INDEX IF NOT EXISTS plays_played_at ON plays (played_at);
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self.queue = queue.Queue()
+        self.writer = None
+        self.lock = threading.Lock()
+        self.schema_ready = False
+
+    def connect(self):
+        if self.db_path is None:
+            self.db_path = os.path.join(get_app_dir(), "history.db")
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        if not self.schema_ready:
+            with self.lock:
+                if not self.schema_ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(self.SCHEMA)
+                    columns = [row[1] for row in conn.execute("PRAGMA table_info(plays)")]
+                    if "channel" not in columns: # history.db from before channels existed
+                        conn.execute("ALTER TABLE plays ADD COLUMN channel TEXT")
+                    self.schema_ready = True
+        return conn
+
+    def record(self, played_at, artist, title, source, path=None, artwork_id=None, channel=DEFAULT_CHANNEL):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.run_writer, daemon=True, name="history-writer")
+                self.writer.start()
+        self.queue.put((played_at, artist, title, source, path, artwork_id, channel))
+
+    def run_writer(self):
+        conn = None
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.BATCH_DELAY
+            while batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                if conn is None:
+                    conn = self.connect()
+                if rows:
+                    with conn:
+                        conn.executemany("INSERT INTO plays (played_at, artist, title, source, path, artwork_id, channel) "
+                                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                print(f"Error saving play history: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+            if batch[-1] is None:
+                if conn is not None:
+                    conn.close()
+                return
+
+    def close(self, timeout=5.0):
+        """Flush queued plays and stop the writer"""
+        with self.lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            self.queue.put(None)
+            writer.join(timeout)
+
+    def query(self, start=None, end=None, limit=100, channel=None):
+        """Plays with start <= played_at < end (of one channel, if given), newest first"""
+        conn = self.connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            sql = "SELECT * FROM plays WHERE played_at >= ? AND played_at < ?"
+            params = [start if start is not None else 0, end if end is not None else float('inf')]
+            if channel:
+                # Rows from before channels existed belong to the default channel
+                sql += " AND coalesce(channel, ?) = ?"
+                params += [DEFAULT_CHANNEL, channel]
+            rows = conn.execute(sql + " ORDER BY played_at DESC, id DESC LIMIT ?", params + [limit]).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+play_history = PlayHistoryStore()
+
+def parse_history_time(value):
+    """Epoch seconds or an ISO 8601 date/time (local time) -> epoch seconds; None if empty"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def format_history(plays, fmt):
+    """Render plays as (content_type, bytes) in json, csv or m3u"""
+    if fmt == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['time', 'artist', 'title', 'source'])
+        for play in reversed(plays): # Setlists read oldest first
+            writer.writerow([datetime.datetime.fromtimestamp(play['played_at']).isoformat(timespec='seconds'),
+                             play['artist'], play['title'], play['source']])
+        return 'text/csv; charset=utf-8', out.getvalue().encode('utf-8')
+    if fmt == 'm3u':
+        lines = ['#EXTM3U']
+        for play in reversed(plays):
+            if play['path']:
+                lines.append(f"#EXTINF:-1,{play['artist']} - {play['title']}")
+                lines.append(play['path'])
+            else:
+                # Streaming tracks have no file to point at
+                lines.append(f"# {play['artist']} - {play['title']} ({play['source']})")
+        return 'audio/x-mpegurl; charset=utf-8', ('\n'.join(lines) + '\n').encode('utf-8')
+    for play in plays:
+        play['time'] = datetime.datetime.fromtimestamp(play['played_at']).isoformat(timespec='seconds')
+        del play['path'] # Local file paths stay out of the web API
+    return 'application/json', json.dumps({'plays': plays}).encode('utf-8')
+
+StatePayload = collections.namedtuple('StatePayload', ['version', 'body', 'gzip_body', 'etag'])
+
+def encode_payload(version, response):
+    body = json.dumps(response).encode('utf-8')
+    # The ETag hashes the content, so it stays valid across restarts
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+    return StatePayload(version, body, gzip.compress(body), etag)
+
+class PlayStats:
+    """Running totals for one channel's plays. Each play updates them in O(1), so nothing
+    ever rescans the history; to_dict() only sorts the artist counter."""
+    RECENT_GAPS = 10 # Gaps behind recent_track_seconds
+    TOP_ARTISTS = 10
+
+    def __init__(self):
+        self.plays = 0
+        self.first_played = None
+        self.last_played = None
+        self.last_hour = collections.deque() # played_at of the plays in the last hour, oldest first
+        self.session_start = None # First play after the last break longer than MAX_TRACK_GAP
+        self.session_plays = 0
+        self.gap_total = 0.0 # Sum and count of gaps between consecutive plays (breaks excluded)
+        self.gap_count = 0
+        self.recent_gaps = collections.deque(maxlen=self.RECENT_GAPS)
+        self.artists = collections.Counter() # normalized artist -> plays
+        self.artist_names = {} # normalized artist -> name as first seen
+        self.sources = collections.Counter()
+        self.version = 0
+
+    def add(self, played_at, artist, source):
+        gap = played_at - self.last_played if self.last_played is not None else None
+        if gap is not None and 0 <= gap <= PollScheduler.MAX_TRACK_GAP:
+            self.gap_total += gap
+            self.gap_count += 1
+            self.recent_gaps.append(gap)
+        else:
+            self.session_start = played_at
+            self.session_plays = 0
+        self.session_plays += 1
+        self.plays += 1
+        if self.first_played is None:
+            self.first_played = played_at
+        self.last_played = played_at
+        self.last_hour.append(played_at)
+        self.expire(played_at)
+        key = normalize_text(artist or "")
+        if key:
+            self.artists[key] += 1
+            self.artist_names.setdefault(key, artist)
+        self.sources[source or "unknown"] += 1
+        self.version += 1
+
+    def expire(self, now):
+        while self.last_hour and now - self.last_hour[0] >= 3600:
+            self.last_hour.popleft()
+
+    def to_dict(self, now):
+        self.expire(now)
+        session = None
+        if self.last_played is not None and now - self.last_played <= PollScheduler.MAX_TRACK_GAP:
+            hours = max(now - self.session_start, 60.0) / 3600
+            session = {
+                "started": self.session_start,
+                "plays": self.session_plays,
+                "tracks_per_hour": round(self.session_plays / hours, 1)
+            }
+        average = lambda total, count: round(total / count, 1) if count else None
+        return {
+            "plays": self.plays,
+            "first_played": self.first_played,
+            "last_played": self.last_played,
+            "tracks_last_hour": len(self.last_hour),
+            "session": session,
+            "average_track_seconds": average(self.gap_total, self.gap_count),
+            "recent_track_seconds": average(sum(self.recent_gaps), len(self.recent_gaps)),
+            "top_artists": [{"artist": self.artist_names[key], "plays": plays}
+                            for key, plays in self.artists.most_common(self.TOP_ARTISTS)],
+            "sources": dict(self.sources.most_common())
+        }
+
+class PlayStatsRegistry:
+    """PlayStats per channel: history.db is replayed into them once at startup, then
+    Channel.announce() keeps them current. /api/stats responses are pre-encoded and reused
+    until a new play arrives or a second has passed (for the rolling hour)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {} # channel name -> PlayStats
+        self.payloads = {} # channel name -> (stats version, second, StatePayload)
+        self.cutoff = None # Plays from before this time come from history.db
+        self.pending = [] # Live plays that arrived while history.db was still being read
+        self.loaded = False
+
+    def record(self, channel, played_at, artist, source):
+        with self.lock:
+            if self.cutoff is not None and not self.loaded:
+                self.pending.append((channel, played_at, artist, source))
+                return
+            self.stats.setdefault(channel, PlayStats()).add(played_at, artist, source)
+
+    def start_loading(self, history, log_callback):
+        """Read history.db in the background; live plays recorded meanwhile are added afterwards"""
+        with self.lock:
+            if self.cutoff is not None:
+                return
+            self.cutoff = time.time()
+        threading.Thread(target=self.load, args=(history, log_callback), daemon=True, name="stats-load").start()
+
+    def load(self, history, log_callback):
+        start = time.perf_counter()
+        stats = {}
+        count = 0
+        try:
+            conn = history.connect()
+            try:
+                rows = conn.execute("SELECT coalesce(channel, ?), played_at, artist, source FROM plays "
+                                    "WHERE played_at < ? ORDER BY played_at, id", (DEFAULT_CHANNEL, self.cutoff))
+                for channel, played_at, artist, source in rows:
+                    stats.setdefault(channel, PlayStats()).add(played_at, artist, source)
+                    count += 1
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            log_callback(f"Error reading play history for stats: {e}")
+        with self.lock:
+            for channel, played_at, artist, source in self.pending:
+                stats.setdefault(channel, PlayStats()).add(played_at, artist, source)
+            self.stats = stats
+            self.pending = []
+            self.loaded = True
+        log_callback(f"Play stats: {count} past plays loaded in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def has(self, channel):
+        return channel in self.stats
+
+    def get_payload(self, channel, now=None):
+        now = time.time() if now is None else now
+        second = int(now)
+        with self.lock:
+            stats = self.stats.get(channel) or PlayStats()
+            cached = self.payloads.get(channel)
+            if cached is not None and cached[0] == stats.version and cached[1] == second:
+                return cached[2]
+            response = dict(stats.to_dict(now), channel=channel, loading=not self.loaded)
+            payload = encode_payload(stats.version, response)
+            self.payloads[channel] = (stats.version, second, payload)
+            return payload
+
+play_stats = PlayStatsRegistry()
+
+class StateBroadcaster:
+    """Holds the current state as pre-encoded JSON with a version number per change.
+    /api/events streams and ?since= long-polls wait here; recent versions are kept
+    so a reconnecting stream can resume from its Last-Event-ID."""
+    def __init__(self, backlog=50):
+        self.condition = threading.Condition()
+        self.events = collections.deque(maxlen=backlog) # StatePayload, oldest first
+        self.payload = None
+        self.version = 0
+
+    def publish(self, response):
+        with self.condition:
+            version = self.version + 1
+            self.payload = encode_payload(version, dict(response, version=version))
+            self.version = version
+            self.events.append(self.payload)
+            self.condition.notify_all()
+
+    def events_since(self, version):
+        """Payloads newer than version, or None if some of them were already dropped"""
+        with self.condition:
+            if version > self.version:
+                return None # Version from before a restart
+            if version == self.version:
+                return []
+            if not self.events or self.events[0].version > version + 1:
+                return None
+            return [e for e in self.events if e.version > version]
+
+    def wait_for(self, version, timeout):
+        """Block until there are payloads newer than version (or timeout) and return them"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > version, timeout)
+        return self.events_since(version)
+
+    def wait_for_payload(self, version, timeout):
+        """Long-poll: the current payload once it is newer than version, or after timeout"""
+        with self.condition:
+            if version > self.version:
+                return self.payload # Version from before a restart
+            self.condition.wait_for(lambda: self.version > version, timeout)
+            return self.payload
+
+class Channel:
+    """One room/booth: its own state, history, duplicate filter and event stream.
+    Any number of sources (local databases, remote agents) can feed the same channel."""
+    def __init__(self, name):
+        self.name = name
+        self.state = NowPlayingState(current=dict(INITIAL_TRACK), history=())
+        self.history = collections.deque(maxlen=HISTORY_SIZE) # Newest first
+        self.lock = threading.Lock() # Serializes writers; readers just take self.state
+        self.broadcaster = StateBroadcaster()
+        self.recent_tracks = RecentTracks(float(current_config.get("dedup_window", 5.0)))
+        self.generation = 0 # Bumped per track; artwork for older tracks must not publish
+        self.listeners = [] # Called with (channel, state) after every publish
+
+    def set_state(self, current, origin_source):
+        """Swap in a new snapshot; call with self.lock held"""
+        self.state = NowPlayingState(current, tuple(self.history), origin_source)
+
+    def announce(self, track, origin_source=None):
+        """Put a new track on air; returns (generation, history_item) for fill_artwork.
+        origin_source is the raw originSourceID for the stats (track["source"] hides 'explorer')."""
+        history_item = track.copy()
+        origin_source = origin_source or track.get('source')
+        with self.lock:
+            self.generation += 1
+            # Artwork jobs of older tracks are dropped, so don't leave them pending
+            for i, item in enumerate(self.history):
+                if item.get('has_artwork') == "pending":
+                    self.history[i] = dict(item, has_artwork=False)
+            self.history.appendleft(history_item)
+            self.set_state(track, origin_source)
+            generation = self.generation
+        self.publish()
+        play_stats.record(self.name, time.time(), track.get('artist'), origin_source)
+        return generation, history_item
+
+    def fill_artwork(self, generation, history_item, fields):
+        """Add artwork to an announced track; False if a newer track is on air by now"""
+        with self.lock:
+            if generation != self.generation:
+                return False
+            for i, item in enumerate(self.history):
+                if item is history_item:
+                    self.history[i] = dict(item, **fields)
+                    break
+            self.set_state(dict(self.state.current, **fields), self.state.origin_source)
+        self.publish()
+        return True
+
+    def build_response(self):
+        """Current state plus display settings, as served by /api/now_playing and /api/events"""
+        state = self.state
+        response = {'current': state.current, 'history': list(state.history), 'channel': self.name}
+        response['settings'] = {
+            'show_history': current_config.get('show_history', True),
+            'show_history_time': current_config.get('show_history_time', True),
+            'show_source': current_config.get('show_source', True)
+        }
+        return response
+
+    def publish(self):
+        """Encode the current state once and hand it to all clients; call after every change"""
+        # Snapshot and publish under one lock so versions follow the order of state changes
+        with self.broadcaster.condition:
+            state = self.state
+            self.broadcaster.publish(self.build_response())
+        for listener in list(self.listeners):
+            try:
+                listener(self, state)
+            except Exception as e:
+                print(f"Channel listener error: {e}")
+
+    def get_payload(self):
+        payload = self.broadcaster.payload
+        if payload is None:
+            self.publish()
+            payload = self.broadcaster.payload
+        return payload
+
+channels = {} # name -> Channel
+channels_lock = threading.Lock()
+
+def get_channel(name=None, create=True):
+    """Channel by name (default channel if None); None if it doesn't exist and create is off or the name is invalid"""
+    name = name or DEFAULT_CHANNEL
+    channel = channels.get(name)
+    # The default channel always exists; it is created on first use so it picks up the loaded config
+    if channel is None and (create or name == DEFAULT_CHANNEL) and CHANNEL_NAME_RE.match(name):
+        with channels_lock:
+            channel = channels.get(name)
+            if channel is None and len(channels) < MAX_CHANNELS:
+                channel = channels[name] = Channel(name)
+    return channel
+
+def publish_state():
+    """Re-publish every channel, e.g. after the display settings changed"""
+    for channel in list(channels.values()):
+        channel.publish()
+
+class NowPlayingServer(ThreadingHTTPServer):
+    """Thread-per-connection HTTP server with a cap on simultaneous clients"""
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, server_address, handler_class, max_clients=64, client_timeout=30):
+        super().__init__(server_address, handler_class)
+        self.client_timeout = client_timeout
+        self.client_slots = threading.BoundedSemaphore(max_clients)
+        self.clients_lock = threading.Lock()
+        self.active_clients = 0
+        self.rejected_clients = 0
+        self.event_streams = 0
+        self.closing = threading.Event() # Set to end event streams left on a retired server
+        metrics.gauge("djay_nowplaying_connected_clients", "Open HTTP connections", lambda: self.active_clients)
+        metrics.gauge("djay_nowplaying_event_streams", "Open /api/events streams", lambda: self.event_streams)
+        metrics.counter("djay_nowplaying_rejected_clients_total", "Connections refused with 503 because max_clients was reached",
+                        lambda: self.rejected_clients)
+
+    def count_client(self, attr, delta):
+        with self.clients_lock:
+            setattr(self, attr, getattr(self, attr) + delta)
+
+    def process_request(self, request, client_address):
+        if not self.client_slots.acquire(blocking=False):
+            # Full: answer right away instead of queueing behind long-lived connections
+            self.count_client('rejected_clients', 1)
+            try:
+                request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n"
+                                b"Retry-After: 5\r\nConnection: close\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.count_client('active_clients', 1)
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.count_client('active_clients', -1)
+            self.client_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.count_client('active_clients', -1)
+            self.client_slots.release()
+
+    def stop_listening(self):
+        """Stop accepting connections; requests already in progress carry on"""
+        self.shutdown()
+        self.server_close()
+
+    def drain(self, timeout):
+        """After stop_listening: wait up to timeout for open connections to finish, then end event streams"""
+        deadline = time.monotonic() + timeout
+        while self.active_clients > self.event_streams and time.monotonic() < deadline:
+            time.sleep(0.2)
+        self.closing.set()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive; every response must carry a Content-Length
+    disable_nagle_algorithm = True # Headers and body are separate writes; don't stall on delayed ACKs
+
+    def setup(self):
+        # Per-connection socket timeout: drops idle keep-alive clients and stalled transfers
+        self.timeout = getattr(self.server, 'client_timeout', None)
+        super().setup()
+
+    def do_GET(self):
+        start = time.perf_counter()
+        route = self.route_get(urllib.parse.urlsplit(self.path))
+        if route:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route)
+
+    def route_get(self, url):
+        """Serve a GET; returns the route name for the latency histogram, or None to leave it out"""
+        if url.path == '/':
+            asset = get_template_asset()
+            self.send_cached(asset.body, asset.gzip_body, asset.etag, asset.content_type,
+                             'no-cache', asset.last_modified)
+            return '/'
+        elif url.path == '/api/now_playing':
+            query = urllib.parse.parse_qs(url.query)
+            channel = self.get_request_channel(query)
+            if channel is None:
+                return 'other'
+            payload = channel.get_payload()
+            try:
+                since = int(query['since'][0])
+            except (KeyError, ValueError):
+                since = None
+            # A version above ours is from before a restart: answer right away, like /api/events
+            if since is not None and payload.version == since:
+                # Long-poll: hold the request until the state moves past the client's version
+                payload = channel.broadcaster.wait_for_payload(since, timeout=25)
+                self.send_payload(payload)
+                return None
+            self.send_payload(payload)
+            return '/api/now_playing'
+        elif url.path == '/api/events':
+            channel = self.get_request_channel(urllib.parse.parse_qs(url.query))
+            if channel is None:
+                return 'other'
+            self.stream_events(channel)
+            return None
+        elif url.path == '/api/channels':
+            body = json.dumps({'channels': sorted(channels)}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(body)
+            return '/api/channels'
+        elif url.path == '/api/stats':
+            name = urllib.parse.parse_qs(url.query).get('channel', [DEFAULT_CHANNEL])[0]
+            if name not in channels and not play_stats.has(name) and name != DEFAULT_CHANNEL:
+                self.send_error(404, "Unknown channel")
+                return 'other'
+            payload = play_stats.get_payload(name)
+            self.send_cached(payload.body, payload.gzip_body, payload.etag, 'application/json', 'no-cache')
+            return '/api/stats'
+        elif url.path == '/api/history':
+            self.send_history(urllib.parse.parse_qs(url.query))
+            return '/api/history'
+        elif url.path == '/metrics':
+            body = metrics.render()
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return '/metrics'
+        elif self.path.startswith('/cover.jpg'):
+            # Artwork of the current track, for templates that predate /artwork/<id>
+            channel = self.get_request_channel(urllib.parse.parse_qs(url.query))
+            if channel is None:
+                return 'other'
+            self.send_artwork(channel.state.current.get('artwork_id'), url, 'no-cache')
+            return '/cover.jpg'
+        elif self.path.startswith('/artwork/'):
+            # Content-addressed, so the bytes behind a URL never change
+            self.send_artwork(url.path[len('/artwork/'):], url, 'public, max-age=31536000, immutable')
+            return '/artwork'
+        else:
+            self.send_error(404)
+            return 'other'
+
+    def do_POST(self):
+        start = time.perf_counter()
+        if urllib.parse.urlsplit(self.path).path != '/api/ingest':
+            self.send_error(404)
+            return
+        self.receive_ingest()
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, '/api/ingest')
+
+    def receive_ingest(self):
+        """POST /api/ingest: a detection from a remote agent, authenticated with the shared ingest_token"""
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            length = -1
+        if length < 0 or length > IngestReceiver.MAX_BYTES:
+            self.close_connection = True # The unread body would be taken for the next request
+            self.send_error(413 if length > 0 else 411)
+            return
+        body = self.rfile.read(length)
+        token = current_config.get("ingest_token")
+        if not token:
+            self.send_error(403, "Ingest is disabled (no ingest_token configured)")
+            return
+        if not hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'),
+                                   f"Bearer {token}".encode('utf-8')):
+            self.send_error(401)
+            return
+        try:
+            result = ingest_receiver.ingest(json.loads(body))
+        except (ValueError, binascii.Error) as e:
+            self.send_error(400, f"Invalid ingest message: {e}")
+            return
+        response = json.dumps({'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+    
+    def is_not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in if_none_match or if_none_match.strip() == '*'
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since and last_modified:
+            try:
+                return (email.utils.parsedate_to_datetime(if_modified_since)
+                        >= email.utils.parsedate_to_datetime(last_modified))
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_cached(self, body, gzip_body, etag, content_type, cache_control, last_modified=None):
+        """Serve in-memory bytes with validators: 304 when the client's copy is current, gzip if accepted"""
+        if self.is_not_modified(etag, last_modified):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        use_gzip = (gzip_body is not None and len(gzip_body) < len(body)
+                    and 'gzip' in self.headers.get('Accept-Encoding', ''))
+        if use_gzip:
+            body = gzip_body
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        if last_modified:
+            self.send_header('Last-Modified', last_modified)
+        if gzip_body is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_payload(self, payload):
+        """Serve a pre-encoded state payload"""
+        self.send_cached(payload.body, payload.gzip_body, payload.etag, 'application/json', 'no-cache')
+
+    def send_history(self, query):
+        """/api/history?from=&to=&limit=&channel=&format=json|csv|m3u, newest first; page with to=<next_to>"""
+        try:
+            start = parse_history_time(query.get('from', [None])[0])
+            end = parse_history_time(query.get('to', [None])[0])
+            limit = max(1, min(int(query.get('limit', ['100'])[0]), 10000))
+        except ValueError:
+            self.send_error(400, "Invalid from/to/limit")
+            return
+        fmt = query.get('format', ['json'])[0]
+        try:
+            plays = play_history.query(start, end, limit, query.get('channel', [None])[0])
+        except sqlite3.Error as e: # e.g. history.db locked for longer than its timeout
+            self.send_error(503, f"Play history unavailable: {e}")
+            return
+        next_to = plays[-1]['played_at'] if len(plays) == limit else None
+        content_type, body = format_history(plays, fmt)
+        if fmt == 'json':
+            body = body[:-1] + b', "next_to": ' + json.dumps(next_to).encode('utf-8') + b'}'
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        if fmt in ('csv', 'm3u'):
+            self.send_header('Content-Disposition', f'attachment; filename="history.{fmt}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_request_channel(self, query):
+        """Channel named by ?channel= (default channel if absent); sends a 404 and returns None if unknown"""
+        channel = get_channel(query.get('channel', [None])[0], create=False)
+        if channel is None:
+            self.send_error(404, "Unknown channel")
+        return channel
+
+    def stream_events(self, channel):
+        """Server-Sent Events: one event per state change, with a comment line as keep-alive"""
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            last_version = int(self.headers.get('Last-Event-ID'))
+        except (TypeError, ValueError):
+            last_version = None
+        broadcaster = channel.broadcaster
+        pending = broadcaster.events_since(last_version) if last_version is not None else None
+        if pending is None:
+            # New client, or too far behind to replay: start from the current state
+            pending = [channel.get_payload()]
+
+        self.server.count_client('event_streams', 1)
+        try:
+            self.wfile.write(b"retry: 3000\n\n")
+            while True:
+                for payload in pending:
+                    self.wfile.write(b"id: %d\ndata: %s\n\n" % (payload.version, payload.body))
+                    last_version = payload.version
+                if not pending:
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+                pending = broadcaster.wait_for(last_version, timeout=15)
+                if self.server.closing.is_set():
+                    break # Retired server: the browser reconnects to the new listener
+                if pending is None:
+                    pending = [channel.get_payload()]
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass # Client went away
+        finally:
+            self.server.count_client('event_streams', -1)
+
+    def send_artwork(self, artwork_id, url, cache_control):
+        """Artwork by id; ?size=<px> gets a thumbnail that fits a size x size box"""
+        try:
+            size = int(urllib.parse.parse_qs(url.query).get('size', ['0'])[0])
+        except ValueError:
+            size = -1
+        if size < 0:
+            self.send_error(400, "Invalid size")
+            return
+        image = artwork_store.get_thumbnail(artwork_id, size) if size else None
+        if image is None:
+            data = artwork_store.get(artwork_id)
+            image = (artwork_id, data) if data is not None else None
+        if image is None:
+            self.send_error(404)
+            return
+        self.send_image(image[0], image[1], cache_control)
+
+    def send_image(self, artwork_id, data, cache_control):
+        # Images are already compressed, so no gzip copy
+        self.send_cached(data, None, f'"{artwork_id}"', ArtworkStore.guess_mime(data), cache_control)
+
+    def log_message(self, format, *args):
+        pass # Disable HTTP request logging
+
+def start_server(host, port, log_callback):
+    """Bind the web server and serve it from a daemon thread; raises OSError if the port is taken"""
+    # Threaded so long-lived /api/events streams don't block other requests
+    httpd = NowPlayingServer((host, port), RequestHandler,
+                             max_clients=int(current_config.get("max_clients", 64)),
+                             client_timeout=float(current_config.get("client_timeout", 30)))
+    def serve():
+        try:
+            httpd.serve_forever()
+        except Exception as e:
+            log_callback(f"Server Error: {e}")
+    threading.Thread(target=serve, daemon=True, name="http-server").start()
+    return httpd
+
+class PlaybackMonitor:
+    """Detects new tracks in one MediaLibrary.db and announces them on a channel.
+    It has no thread of its own: a MonitorHub calls poll() on every source."""
+    def __init__(self, db_path, log_callback, channel=None, artwork_pool=None, index_file=None):
+        self.db_path = db_path
+        self.log_callback = log_callback
+        self.channel = channel or get_channel()
+        self.library = LibraryConnection(db_path)
+        self.artwork_manager = ArtworkManager(db_path, self.library, log_callback, index_file)
+        self.library_generation = 0
+        self.last_stats_log = time.time()
+        self.last_rowid = None # Watermark: highest database2 rowid seen so far
+        self.last_rowid_crc = None # Fingerprint of the watermark row, detects rowid reuse
+        self.target_collections = [
+            'historySessionItems'
+        ]
+        self.poll_interval = current_config.get("poll_interval", 0.5)
+        self.scheduler = None
+        if current_config.get("adaptive_polling", True):
+            self.scheduler = PollScheduler(float(current_config.get("poll_min_interval", 0.2)),
+                                           float(current_config.get("poll_max_interval", 2.0)))
+        self.poll_changed = False # Set by get_snapshot when the DB had new commits
+        self.poll_detected = False # Set when a poll announced a track
+        self.current_interval = self.poll_interval
+        # Artwork is extracted off the detection path; only the newest track's job matters.
+        # A MonitorHub shares one pool between its sources; a standalone monitor gets its own.
+        self.owns_artwork_pool = artwork_pool is None
+        if artwork_pool is None:
+            artwork_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, int(current_config.get("artwork_workers", 2))), thread_name_prefix="artwork")
+        self.artwork_pool = artwork_pool
+        self.artwork_job = None
+        self.detections = 0
+        self.poll_errors = 0
+        self.last_error = None
+        self.last_error_log = 0
+        self.last_query_time = 0.0
+
+    def parse_blob(self, blob_data):
+        try:
+            record = decode_blob(blob_data, want_source=True, want_deck=True)
+        except:
+            return None
+        if record.title is None and record.artist is None: return None
+        return TrackRecord(record.artist or "Unknown", record.title or "Unknown", record.source or "Unknown", None, record.deck)
+
+    def set_watermark(self, rowid):
+        self.last_rowid = rowid
+        self.last_rowid_crc = self.library.get_row_fingerprint(rowid)
+
+    def get_snapshot(self):
+        """Fetch target rows added since the last call, keyed by rowid.
+        The first call only records the watermark, so existing history is never reported."""
+        snapshot = {}
+        query_start = None
+        try:
+            if not self.library.has_changed():
+                return snapshot, None
+
+            self.poll_changed = True
+            query_start = time.perf_counter()
+            max_rowid = self.library.execute("SELECT MAX(rowid) FROM database2")[0][0] or 0
+
+            if self.library.generation != self.library_generation:
+                # MediaLibrary.db was replaced on disk: its rowids are unrelated to ours
+                self.library_generation = self.library.generation
+                if self.last_rowid is not None:
+                    self.log_callback("Database file was replaced, resetting watermark.")
+                    self.last_rowid = None
+
+            if self.last_rowid is None:
+                self.set_watermark(max_rowid)
+                return snapshot, None
+
+            if max_rowid < self.last_rowid:
+                # Table shrank (DB rebuilt or newest rows deleted): start over from here
+                self.log_callback(f"Database rowids went backwards ({self.last_rowid} -> {max_rowid}), resetting watermark.")
+                self.set_watermark(max_rowid)
+                return snapshot, None
+
+            start_rowid = self.last_rowid
+            if self.library.get_row_fingerprint(self.last_rowid) != self.last_rowid_crc:
+                # The watermark row was deleted and its rowid handed to a new row
+                start_rowid = self.last_rowid - 1
+            elif max_rowid == self.last_rowid:
+                return snapshot, None
+
+            placeholders = ','.join(['?'] * len(self.target_collections))
+            query = (f"SELECT rowid, collection, data FROM database2 "
+                     f"WHERE rowid > ? AND rowid <= ? AND collection IN ({placeholders}) ORDER BY rowid")
+            for r in self.library.execute(query, [start_rowid, max_rowid] + self.target_collections):
+                snapshot[r[0]] = {'collection': r[1], 'data': r[2]}
+            self.set_watermark(max_rowid)
+            return snapshot, None
+        except Exception as e:
+            self.poll_errors += 1
+            return None, str(e)
+        finally:
+            if query_start is not None:
+                self.last_query_time = time.perf_counter() - query_start
+                DB_QUERY_SECONDS.observe(self.last_query_time)
+
+    def log_stats(self, polling=True):
+        """Periodically log database connection counters"""
+        now = time.time()
+        if now - self.last_stats_log < 300:
+            return
+        self.last_stats_log = now
+        stats = self.library.stats
+        self.log_callback(f"DB stats: {stats['connects']} connects, {stats['queries']} queries, "
+                          f"{stats['skips']} skipped polls, {stats['errors']} errors")
+        if self.scheduler and polling:
+            self.log_callback(f"Poll stats: average interval {self.scheduler.average_interval():.2f} s")
+
+    def next_poll_delay(self):
+        """Seconds to sleep before the next poll: fixed poll_interval, or the adaptive scheduler's pick"""
+        if self.scheduler:
+            now = time.monotonic()
+            self.scheduler.record(self.poll_changed, self.poll_detected, now)
+            self.current_interval = self.scheduler.next_interval(self.poll_interval, now)
+        else:
+            self.current_interval = self.poll_interval
+        self.poll_changed = self.poll_detected = False
+        return self.current_interval
+
+    def log_db_error(self, err):
+        """Log a failed poll; a persisting error is repeated at most once a minute"""
+        now = time.time()
+        if err != self.last_error or now - self.last_error_log >= 60:
+            self.log_callback(f"DB Error: {err}")
+            self.last_error = err
+            self.last_error_log = now
+
+    def is_duplicate(self, track_data):
+        return self.channel.recent_tracks.is_duplicate(track_data.artist, track_data.title, track_data.deck)
+
+    @staticmethod
+    def artwork_fields(artwork_id):
+        return {
+            "has_artwork": artwork_id is not None,
+            "artwork_id": artwork_id,
+            "artwork_url": f"/artwork/{artwork_id}" if artwork_id else None,
+            "artwork_ts": int(time.time())
+        }
+
+    def fetch_artwork(self, generation, track_data, history_item):
+        """Artwork worker: extract artwork and fill it into the published state"""
+        if generation != self.channel.generation:
+            return
+        start = time.perf_counter()
+        artwork_id = self.artwork_manager.extract_artwork(track_data.artist, track_data.title)
+        ARTWORK_SECONDS.observe(time.perf_counter() - start)
+        sizes = current_config.get("thumbnail_sizes")
+        if artwork_id and HAS_PIL and sizes:
+            # Scale it here, off the request path, so the overlay's first ?size= fetch is a cache hit
+            missing = [size for size in sizes if (artwork_id, size) not in artwork_store.unscaled
+                       and not artwork_store.contains(f"{artwork_id}-{size}")]
+            if missing:
+                artwork_store.make_thumbnails(artwork_id, missing)
+        if not self.channel.fill_artwork(generation, history_item, self.artwork_fields(artwork_id)):
+            return # A newer track is on air by now
+        elapsed = (time.perf_counter() - start) * 1000
+        self.log_callback(f"Artwork for {track_data.artist} - {track_data.title}: {'Yes' if artwork_id else 'No'} ({elapsed:.0f} ms)")
+
+    def begin(self):
+        self.log_callback(f"Loaded {len(self.artwork_manager.path_cache)} file paths for artwork.")
+        # Establish the rowid watermark; rows already in the DB are old history
+        self.get_snapshot()
+
+    def poll(self):
+        """Read rows added since the last poll and announce new tracks"""
+        current_snapshot, err = self.get_snapshot()
+        if err:
+            self.log_db_error(err)
+            return
+        self.last_error = None
+        
+        if not current_snapshot: return
+        read_at = time.perf_counter()
+
+        for rowid, info in current_snapshot.items():
+            parse_start = time.perf_counter()
+            track_data = self.parse_blob(info['data'])
+            parse_time = time.perf_counter() - parse_start
+            PARSE_SECONDS.observe(parse_time)
+            if track_data:
+                track_str = f"{track_data.artist} - {track_data.title}"
+                if not self.is_duplicate(track_data):
+                    timestamp = datetime.datetime.now().strftime('%H:%M:%S')
+                    
+                    # Artwork: publish right away if already known, otherwise hand it to a worker
+                    if HAS_MUTAGEN:
+                        cached, artwork_id = self.artwork_manager.lookup_cached(track_data.artist, track_data.title)
+                    else:
+                        cached, artwork_id = True, None
+                    artwork = self.artwork_fields(artwork_id)
+                    if not cached:
+                        artwork["has_artwork"] = "pending"
+                    
+                    raw_source = track_data.source
+                    display_source = raw_source
+                    
+                    # Logic: Hide 'explorer' always.
+                    if str(raw_source).lower() == 'explorer':
+                        display_source = None
+                    else:
+                        display_source = raw_source
+                    
+                    new_track = {
+                        "artist": track_data.artist,
+                        "title": track_data.title,
+                        "source": display_source,
+                        "status": "Playing",
+                        "timestamp": timestamp,
+                        "type": "playing",
+                        **artwork
+                    }
+                    
+                    generation, history_item = self.channel.announce(new_track, raw_source)
+                    publish_time = time.perf_counter() - read_at
+                    PUBLISH_SECONDS.observe(publish_time)
+                    self.detections += 1
+                    self.poll_detected = True
+
+                    if self.artwork_job is not None:
+                        self.artwork_job.cancel() # No-op if already running; it will see the new generation
+                        self.artwork_job = None
+                    if not cached:
+                        self.artwork_job = self.artwork_pool.submit(
+                            self.fetch_artwork, generation, track_data, history_item)
+                    
+                    if current_config.get("save_history", True):
+                        play_history.record(time.time(), track_data.artist, track_data.title, raw_source,
+                                            self.artwork_manager.lookup_path(track_data.artist, track_data.title),
+                                            artwork_id, self.channel.name)
+                    
+                    art_status = 'pending' if not cached else ('Yes' if artwork_id else 'No')
+                    self.log_callback(f"[{timestamp}] Detected: {track_str} (ON AIR) [Source: {raw_source}] [Art: {art_status}]")
+                    if current_config.get("debug_timings", False):
+                        self.log_callback(f"Timings: query {self.last_query_time * 1000:.1f} ms, "
+                                          f"parse {parse_time * 1000:.2f} ms, publish {publish_time * 1000:.1f} ms")
+
+    def close(self):
+        """Release the DB and flush what is only held in memory"""
+        if self.owns_artwork_pool:
+            self.artwork_pool.shutdown(wait=False)
+        with self.artwork_manager.scan_lock:
+            if self.artwork_manager.index_dirty:
+                self.artwork_manager.save_index_cache()
+        with self.library.lock:
+            self.library.close()
+
+class MonitorHub(threading.Thread):
+    """Runs every local source from a single thread.
+    In poll mode each source keeps its own adaptive schedule; in events mode one
+    watcher covers all databases and only the ones that were written are read."""
+    def __init__(self, sources, log_callback):
+        super().__init__(daemon=True, name="monitor")
+        self.log_callback = log_callback
+        self.stop_event = threading.Event()
+        self.detection_mode = current_config.get("detection_mode", "poll")
+        self.watcher = None
+        self.artwork_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, int(current_config.get("artwork_workers", 2))), thread_name_prefix="artwork")
+        self.monitors = []
+        for source in sources:
+            log = log_callback
+            index_file = None
+            if len(sources) > 1:
+                log = lambda message, name=source["name"]: log_callback(f"[{name}] {message}")
+                digest = hashlib.sha1(os.path.abspath(source["db_path"]).encode('utf-8')).hexdigest()[:10]
+                index_file = f"artwork_index-{digest}.json"
+            self.monitors.append(PlaybackMonitor(source["db_path"], log, get_channel(source["channel"]),
+                                                 self.artwork_pool, index_file))
+
+        monitors = self.monitors
+        def total(attr=None, stat=None):
+            return lambda: sum(getattr(m, attr) if attr else m.library.stats[stat] for m in monitors)
+        metrics.counter("djay_nowplaying_detections_total", "Tracks announced", total("detections"))
+        metrics.counter("djay_nowplaying_poll_errors_total", "Polls that failed to read MediaLibrary.db",
+                        total("poll_errors"))
+        metrics.counter("djay_nowplaying_db_errors_total", "SQLite errors (each one reopens the connection)",
+                        total(stat="errors"))
+        metrics.counter("djay_nowplaying_db_queries_total", "Queries run against MediaLibrary.db", total(stat="queries"))
+        metrics.counter("djay_nowplaying_poll_skips_total", "Polls skipped because the DB had not changed",
+                        total(stat="skips"))
+        metrics.counter("djay_nowplaying_db_connects_total", "Connections opened to MediaLibrary.db",
+                        total(stat="connects"))
+        metrics.gauge("djay_nowplaying_poll_interval_seconds", "Shortest delay before the next poll (poll mode)",
+                      lambda: min(m.current_interval for m in monitors))
+        metrics.gauge("djay_nowplaying_sources", "Local databases being monitored", lambda: len(monitors))
+
+    def set_poll_interval(self, interval):
+        for monitor in self.monitors:
+            monitor.poll_interval = interval
+
+    def run(self):
+        self.log_callback("Monitor thread started...")
+        for monitor in self.monitors:
+            monitor.begin()
+
+        if self.detection_mode == "events":
+            self.watcher = DbChangeWatcher([m.db_path for m in self.monitors])
+            if self.watcher.backend:
+                self.log_callback(f"Event-driven detection enabled ({self.watcher.backend}).")
+            else:
+                self.log_callback("File change events unavailable, falling back to polling.")
+                self.watcher = None
+
+        due = {monitor: time.monotonic() + monitor.next_poll_delay() for monitor in self.monitors}
+        while not self.stop_event.is_set():
+            if self.watcher:
+                # Slow fallback poll of every source in case an event is missed (e.g. network drives)
+                changed = self.watcher.wait(current_config.get("event_fallback_interval", 5.0))
+                targets = [m for m in self.monitors if m.db_path in changed] if changed else self.monitors
+            else:
+                # Sleep until the source that is due first
+                delay = min(due.values()) - time.monotonic()
+                if delay > 0:
+                    self.stop_event.wait(delay)
+                now = time.monotonic()
+                targets = [m for m in self.monitors if due[m] <= now]
+            if self.stop_event.is_set():
+                break
+            for monitor in targets:
+                # One failing tick must not end detection for every source
+                try:
+                    monitor.log_stats(polling=self.watcher is None)
+                    monitor.poll()
+                    delay = monitor.next_poll_delay()
+                except Exception as e:
+                    self.log_callback(f"Monitor error ({monitor.db_path}): {e}")
+                    delay = monitor.poll_interval
+                if not self.watcher:
+                    due[monitor] = time.monotonic() + delay
+
+        # Stopped: release the DBs and flush what is only held in memory
+        if self.watcher:
+            self.watcher.close()
+        self.artwork_pool.shutdown(wait=False)
+        for monitor in self.monitors:
+            monitor.close()
+        self.log_callback("Monitor thread stopped.")
+
+    def stop(self):
+        """Ask the monitor loop to exit; it finishes the current poll first"""
+        self.stop_event.set()
+        watcher = self.watcher
+        if watcher:
+            watcher.wake()
+
+def get_sources(db_path):
+    """Local databases to monitor: db_path on the default channel plus the configured "sources" """
+    sources = []
+    if db_path:
+        sources.append({"name": "djay", "db_path": db_path, "channel": DEFAULT_CHANNEL})
+    for i, source in enumerate(current_config.get("sources") or []):
+        if not isinstance(source, dict) or not source.get("db_path"):
+            continue
+        channel = source.get("channel") or DEFAULT_CHANNEL
+        if not CHANNEL_NAME_RE.match(channel):
+            print(f"Skipping source with invalid channel name: {channel!r}")
+            continue
+        sources.append({"name": source.get("name") or f"source{i + 1}", "db_path": source["db_path"],
+                        "channel": channel})
+    return sources
+
+class IngestReceiver:
+    """Applies detections that remote agents POST to /api/ingest to their channels"""
+    MAX_BYTES = 8 * 1024 * 1024 # Artwork comes base64-encoded in the same request
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.plays = {} # (agent, channel) -> (play_id, generation, history_item) of its last track
+        self.received = 0
+        metrics.counter("djay_nowplaying_ingested_total", "Detections received from remote agents",
+                        lambda: self.received)
+
+    def ingest(self, message):
+        """Returns "announced", "updated" or "duplicate"; raises ValueError for a malformed message"""
+        if not isinstance(message, dict) or not isinstance(message.get("track"), dict):
+            raise ValueError("Expected {channel, agent, play_id, track: {...}}")
+        channel = get_channel(message.get("channel"))
+        if channel is None:
+            raise ValueError("Invalid channel name")
+        track = message["track"]
+        artist = str(track.get("artist") or "Unknown")
+        title = str(track.get("title") or "Unknown")
+        key = (str(message.get("agent", ""))[:64], channel.name)
+        play_id = message.get("play_id")
+
+        if message.get("artwork"):
+            artwork = PlaybackMonitor.artwork_fields(artwork_store.put(base64.b64decode(message["artwork"], validate=True)))
+        elif track.get("has_artwork") == "pending":
+            artwork = dict(PlaybackMonitor.artwork_fields(None), has_artwork="pending")
+        else:
+            artwork = PlaybackMonitor.artwork_fields(None)
+        self.received += 1
+
+        with self.lock:
+            last = self.plays.get(key)
+            if last is not None and play_id is not None and last[0] == play_id:
+                # Same play as before: the agent is sending the artwork it just found
+                # (without a play_id every message is a new play)
+                if artwork["has_artwork"] != "pending":
+                    channel.fill_artwork(last[1], last[2], artwork)
+                return "updated"
+            if channel.recent_tracks.is_duplicate(artist, title):
+                return "duplicate"
+            source = track.get("source")
+            # Agents from before origin_source only send the display source
+            origin_source = track.get("origin_source") or source
+            origin_source = str(origin_source) if origin_source else None
+            new_track = {
+                "artist": artist,
+                "title": title,
+                "source": str(source) if source else None,
+                "status": "Playing",
+                "timestamp": datetime.datetime.now().strftime('%H:%M:%S'),
+                "type": "playing",
+                **artwork
+            }
+            generation, history_item = channel.announce(new_track, origin_source)
+            self.plays[key] = (play_id, generation, history_item)
+        if current_config.get("save_history", True):
+            play_history.record(time.time(), artist, title, origin_source, None,
+                                new_track["artwork_id"], channel.name)
+        return "announced"
+
+ingest_receiver = IngestReceiver()
+
+# ================= Sinks =================
+# Outputs that are pushed to instead of polled: webhooks, UDP broadcasts, text
+# files for OBS and agent push. Each sink is a channel listener with its own
+# thread, so a slow consumer only ever delays itself.
+
+SINK_DELIVERY_SECONDS = metrics.histogram("djay_nowplaying_sink_delivery_seconds",
+                                          "Time to deliver one track to an output sink", label="sink")
+
+class Sink:
+    """Delivers a channel's current track from a background thread.
+    Only the newest track is queued, so rapid changes coalesce; failures are retried with backoff
+    until they succeed or a newer track replaces them."""
+    kind = "sink"
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, log_callback, coalesce=0.3):
+        self.log_callback = log_callback
+        self.coalesce = float(coalesce) # Wait this long for a newer state (e.g. the artwork) before sending
+        self.condition = threading.Condition()
+        self.pending = None # (play_id, current track) waiting to be delivered
+        self.closed = False
+        self.delivered = 0
+        self.failures = 0
+        self.coalesced = 0
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True, name=f"sink-{self.kind}").start()
+        return self
+
+    def __call__(self, channel, state):
+        """Channel listener: queue the current track, replacing anything not delivered yet"""
+        if state.current.get("type") != "playing":
+            return
+        with self.condition:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (channel.generation, state.current, channel.name)
+            self.condition.notify()
+
+    def run(self):
+        sent = None
+        backoff = 1.0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None or self.closed)
+                if self.closed:
+                    return
+                # Let a burst of changes (a new track, then its artwork) settle; newer states replace older
+                deadline = time.monotonic() + self.coalesce
+                while not self.closed and deadline > time.monotonic():
+                    self.condition.wait(deadline - time.monotonic())
+                play_id, current, channel_name = self.pending
+                self.pending = None
+            key = (play_id, current.get("has_artwork"))
+            if key == sent:
+                continue # e.g. a settings re-publish
+            start = time.perf_counter()
+            try:
+                self.deliver(play_id, current, channel_name)
+                SINK_DELIVERY_SECONDS.observe(time.perf_counter() - start, self.kind)
+                self.delivered += 1
+                sent = key
+                backoff = 1.0
+            except Exception as e: # Any delivery error (bad HTTP reply, etc.) must not end the thread
+                self.failures += 1
+                self.log_callback(f"{self} failed: {e}; retrying in {backoff:.0f} s")
+                with self.condition:
+                    # Retry unless a newer track arrives first
+                    if not self.condition.wait_for(lambda: self.pending is not None or self.closed, backoff):
+                        self.pending = (play_id, current, channel_name)
+                backoff = min(self.MAX_BACKOFF, backoff * 2)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def deliver(self, play_id, current, channel_name):
+        """Send one track; raise to have it retried"""
+        raise NotImplementedError
+
+    @staticmethod
+    def track_message(play_id, current, channel_name):
+        """JSON body shared by the webhook and UDP sinks"""
+        track = {key: current.get(key) for key in ("artist", "title", "source", "timestamp",
+                                                   "has_artwork", "artwork_url")}
+        return json.dumps({"channel": channel_name, "play_id": play_id, "track": track}).encode('utf-8')
+
+class WebhookSink(Sink):
+    """POSTs each track as JSON to a URL, e.g. a chat bot or a radio metadata encoder"""
+    kind = "webhook"
+
+    def __init__(self, log_callback, url, headers=None, timeout=5.0, coalesce=0.3):
+        super().__init__(log_callback, coalesce)
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"Unsupported webhook URL: {url}")
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = float(timeout)
+
+    def __str__(self):
+        return f"Webhook {self.url}"
+
+    def deliver(self, play_id, current, channel_name):
+        headers = {"Content-Type": "application/json", **self.headers}
+        request = urllib.request.Request(self.url, data=self.track_message(play_id, current, channel_name),
+                                         headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+class UdpSink(Sink):
+    """Sends each track as one JSON datagram (broadcast by default) to listeners on the LAN"""
+    kind = "udp"
+
+    def __init__(self, log_callback, port, host="255.255.255.255", coalesce=0.3):
+        super().__init__(log_callback, coalesce)
+        self.address = (host, int(port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def __str__(self):
+        return f"UDP {self.address[0]}:{self.address[1]}"
+
+    def deliver(self, play_id, current, channel_name):
+        self.sock.sendto(self.track_message(play_id, current, channel_name), self.address)
+
+    def close(self):
+        super().close()
+        self.sock.close()
+
+class FileSink(Sink):
+    """Writes the current track to a text file (e.g. an OBS text source), replacing it atomically
+    so readers never see a half-written file"""
+    kind = "file"
+
+    class Fields(dict):
+        def __missing__(self, key):
+            return ""
+
+    def __init__(self, log_callback, path, format="{artist} - {title}", coalesce=0.0):
+        super().__init__(log_callback, coalesce)
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.format = format
+        format.format_map(self.Fields()) # Reject a broken format now rather than on every track
+
+    def __str__(self):
+        return f"File {self.path}"
+
+    def deliver(self, play_id, current, channel_name):
+        fields = self.Fields({key: value for key, value in current.items() if value is not None},
+                             channel=channel_name)
+        text = self.format.format_map(fields)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+class IngestPusher(Sink):
+    """Agent mode: forwards the track to another server's /api/ingest, artwork included"""
+    kind = "ingest"
+
+    def __init__(self, log_callback, url, token, remote_channel):
+        super().__init__(log_callback, coalesce=0.0)
+        url = url.rstrip('/')
+        self.url = url if url.endswith('/api/ingest') else url + '/api/ingest'
+        self.token = token
+        self.remote_channel = remote_channel
+        self.agent = f"{socket.gethostname()}-{os.getpid()}"
+
+    def __str__(self):
+        return f"Push to {self.url}"
+
+    def __call__(self, channel, state):
+        # The server's stats and history want the raw originSourceID, not the display source
+        super().__call__(channel, state._replace(current=dict(state.current, origin_source=state.origin_source)))
+
+    def build_message(self, play_id, current):
+        message = {
+            "agent": self.agent,
+            "channel": self.remote_channel,
+            "play_id": play_id,
+            "track": {key: current.get(key) for key in ("artist", "title", "source", "origin_source", "has_artwork")}
+        }
+        data = artwork_store.get(current.get("artwork_id")) if current.get("has_artwork") is True else None
+        if data:
+            message["artwork"] = base64.b64encode(data).decode('ascii')
+        return json.dumps(message).encode('utf-8')
+
+    def deliver(self, play_id, current, channel_name):
+        request = urllib.request.Request(self.url, data=self.build_message(play_id, current), method="POST",
+                                         headers={"Content-Type": "application/json",
+                                                  "Authorization": f"Bearer {self.token}"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+SINK_TYPES = {"webhook": WebhookSink, "udp": UdpSink, "file": FileSink}
+active_sinks = [] # (channel, sink) pairs currently attached
+
+metrics.counter("djay_nowplaying_sink_deliveries_total", "Tracks delivered by output sinks",
+                lambda: sum(sink.delivered for _, sink in active_sinks))
+metrics.counter("djay_nowplaying_sink_failures_total", "Failed sink deliveries (each is retried)",
+                lambda: sum(sink.failures for _, sink in active_sinks))
+metrics.counter("djay_nowplaying_sink_coalesced_total", "Track states replaced before a sink delivered them",
+                lambda: sum(sink.coalesced for _, sink in active_sinks))
+
+def start_sinks(log_callback):
+    """Attach the configured "sinks" (and agent push) to their channels"""
+    configured = []
+    if current_config.get("push_url"):
+        configured.append((DEFAULT_CHANNEL, IngestPusher, {
+            "url": current_config["push_url"], "token": current_config.get("push_token", ""),
+            "remote_channel": current_config.get("push_channel") or DEFAULT_CHANNEL}))
+    for options in current_config.get("sinks") or []:
+        if not isinstance(options, dict) or options.get("type") not in SINK_TYPES:
+            log_callback(f"Ignoring sink with unknown type: {options!r}")
+            continue
+        options = dict(options)
+        configured.append((options.pop("channel", None), SINK_TYPES[options.pop("type")], options))
+
+    for channel_name, cls, options in configured:
+        channel = get_channel(channel_name)
+        if channel is None:
+            log_callback(f"Ignoring sink with invalid channel name: {channel_name!r}")
+            continue
+        try:
+            sink = cls(log_callback, **options)
+        except Exception as e: # One bad entry in config.json must not stop the rest of the app
+            log_callback(f"Invalid {cls.kind} sink {options!r}: {e}")
+            continue
+        channel.listeners.append(sink.start())
+        active_sinks.append((channel, sink))
+        log_callback(f"Output: {sink} (channel {channel.name})")
+
+def stop_sinks():
+    """Detach and stop every sink started by start_sinks"""
+    while active_sinks:
+        channel, sink = active_sinks.pop()
+        if sink in channel.listeners:
+            channel.listeners.remove(sink)
+        sink.close()
+
+# ================= Runtime =================
+
+class NowPlayingService:
+    """The running web server, monitors and sinks. apply_config() brings them in line with
+    current_config without a restart; parts whose settings did not change are left alone."""
+    SERVER_KEYS = ("port", "max_clients", "client_timeout")
+    SINK_KEYS = ("sinks", "push_url", "push_token", "push_channel")
+    MONITOR_KEYS = ("db_path", "sources", "detection_mode", "artwork_workers",
+                    "adaptive_polling", "poll_min_interval", "poll_max_interval")
+    DISPLAY_KEYS = ("show_source", "show_history", "show_history_time")
+    LIVE_KEYS = ("poll_interval", "dedup_window")
+    DRAIN_TIMEOUT = 30.0 # Seconds a retired listener keeps serving its open connections
+
+    def __init__(self, host, log_callback, find_port=False):
+        self.host = host
+        self.log_callback = log_callback
+        self.find_port = find_port # GUI: move on to the next free port instead of failing
+        self.lock = threading.Lock() # One apply_config at a time
+        self.httpd = None
+        self.port = None
+        self.hub = None
+        self.db_path = None
+        self.applied = self.snapshot()
+
+    def snapshot(self):
+        keys = self.SERVER_KEYS + self.SINK_KEYS + self.MONITOR_KEYS + self.DISPLAY_KEYS + self.LIVE_KEYS
+        return {key: current_config.get(key) for key in keys}
+
+    def bind_server(self):
+        port = int(current_config.get("port", 8000))
+        if self.find_port:
+            port = find_available_port(port)
+        return start_server(self.host, port, self.log_callback), port
+
+    def start_server(self):
+        """Bind the web server; raises OSError if the port is taken"""
+        with self.lock:
+            self.httpd, self.port = self.bind_server()
+            self.log_callback(f"Server started on port {self.port}")
+
+    def start_monitors(self, db_path):
+        """Start the output sinks and the monitor hub for db_path plus the configured extra sources"""
+        with self.lock:
+            play_stats.start_loading(play_history, self.log_callback)
+            start_sinks(self.log_callback)
+            self.db_path = db_path
+            self.hub = MonitorHub(get_sources(db_path), self.log_callback)
+            if self.hub.monitors:
+                self.hub.start()
+            for monitor in self.hub.monitors:
+                self.log_callback(f"Monitoring database: {monitor.db_path} (channel {monitor.channel.name})")
+
+    def apply_config(self):
+        """Apply changes in current_config to the running parts; call after saving or reloading it.
+        Keys are only recorded as applied once that succeeded, so a failed change is retried next time."""
+        with self.lock:
+            target = self.snapshot()
+            changed = lambda keys: any(self.applied.get(key) != target[key] for key in keys)
+            applied = dict(self.applied)
+            def done(keys):
+                applied.update((key, target[key]) for key in keys)
+            if changed(self.DISPLAY_KEYS):
+                publish_state() # Display settings are part of the pushed state
+            done(self.DISPLAY_KEYS)
+            if changed(("dedup_window",)):
+                for channel in list(channels.values()):
+                    channel.recent_tracks.window = float(target["dedup_window"])
+            if changed(("poll_interval",)) and self.hub:
+                self.hub.set_poll_interval(float(target["poll_interval"]))
+            done(self.LIVE_KEYS)
+            if changed(self.SERVER_KEYS):
+                if self.update_server(changed(("port",)), changed(("max_clients",))):
+                    done(self.SERVER_KEYS)
+            if changed(self.SINK_KEYS):
+                stop_sinks()
+                start_sinks(self.log_callback)
+            done(self.SINK_KEYS)
+            if not changed(self.MONITOR_KEYS) or not self.hub or self.swap_monitors():
+                done(self.MONITOR_KEYS)
+            self.applied = applied
+
+    def update_server(self, port_changed, limits_changed):
+        """Bring the web server in line with port/max_clients/client_timeout; False if it failed"""
+        old, old_port = self.httpd, self.port
+        if old is None:
+            # Not running (a previous rebind failed): just try to bind again
+            try:
+                self.httpd, self.port = self.bind_server()
+            except OSError as e:
+                self.log_callback(f"Web server is DOWN: cannot listen on port {current_config.get('port')}: {e}")
+                return False
+            self.log_callback(f"Server started on port {self.port}")
+            return True
+        if not port_changed and not limits_changed:
+            # Only the timeout: it is read per connection, no new listener needed
+            old.client_timeout = float(current_config.get("client_timeout", 30))
+            return True
+        if port_changed:
+            # Bind first, so a taken port leaves the running server untouched
+            try:
+                self.httpd, self.port = self.bind_server()
+            except OSError as e:
+                self.log_callback(f"Cannot listen on port {current_config.get('port')}: {e}; "
+                                  f"still serving on port {old_port}")
+                return False
+            old.stop_listening()
+        else:
+            # Same port (new max_clients): it has to be released before it can be bound again
+            old.stop_listening()
+            try:
+                self.httpd = start_server(self.host, old_port, self.log_callback)
+            except OSError as e:
+                self.httpd = None
+                self.log_callback(f"Web server is DOWN: cannot listen on port {old_port} again: {e}. "
+                                  "It is retried on the next settings change.")
+                threading.Thread(target=old.drain, args=(self.DRAIN_TIMEOUT,), daemon=True, name="http-drain").start()
+                return False
+        threading.Thread(target=old.drain, args=(self.DRAIN_TIMEOUT,), daemon=True, name="http-drain").start()
+        self.log_callback(f"Server moved to port {self.port}" if port_changed
+                          else f"Server restarted on port {self.port}")
+        return True
+
+    def swap_monitors(self):
+        """Replace the monitor hub; False if the new settings could not be used.
+        The new hub loads its artwork indexes while the old one keeps detecting,
+        so the switch itself only takes a moment."""
+        db_path = find_db_path(remember=False)
+        if not db_path and not current_config.get("sources"):
+            self.log_callback(f"MediaLibrary.db not found: {current_config.get('db_path')}; "
+                              f"still monitoring {self.db_path}")
+            return False
+        self.log_callback("Database settings changed, starting new monitors...")
+        try:
+            hub = MonitorHub(get_sources(db_path), self.log_callback)
+        except Exception as e:
+            self.log_callback(f"Cannot start the new monitors: {e}; still monitoring {self.db_path}")
+            return False
+        old = self.hub
+        old.stop()
+        if old.is_alive():
+            old.join(5.0)
+        self.hub = hub
+        self.db_path = db_path
+        if hub.monitors:
+            hub.start()
+        for monitor in hub.monitors:
+            self.log_callback(f"Monitoring database: {monitor.db_path} (channel {monitor.channel.name})")
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.hub:
+                self.hub.stop()
+            if self.httpd:
+                self.httpd.stop_listening()
+            if self.hub and self.hub.is_alive():
+                self.hub.join(5.0)
+
+class ConfigWatcher(threading.Thread):
+    """Reloads config.json when it is edited outside the app and applies the changes live"""
+    CHECK_INTERVAL = 2.0 # Fallback stat() interval when file change events are unavailable
+
+    def __init__(self, service, log_callback):
+        super().__init__(daemon=True, name="config-watcher")
+        self.service = service
+        self.log_callback = log_callback
+        self.stop_event = threading.Event()
+        self.config_path = os.path.join(get_app_dir(), CONFIG_FILE)
+        self.watcher = DbChangeWatcher(self.config_path)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.watcher.backend:
+                self.watcher.wait(self.CHECK_INTERVAL)
+            else:
+                self.stop_event.wait(self.CHECK_INTERVAL)
+            if self.stop_event.is_set() or get_config_stat(self.config_path) == config_stat:
+                continue
+            time.sleep(0.1) # Editors often write in several steps
+            self.log_callback(f"{CONFIG_FILE} changed, applying settings")
+            load_config()
+            try:
+                self.service.apply_config()
+            except Exception as e:
+                self.log_callback(f"Error applying settings: {e}")
+        self.watcher.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.watcher.wake()
+
+class MonitorGUI:
+    LOG_FLUSH_MS = 250
+    LOG_BATCH = 500 # Messages per flush, so a burst can't stall the event loop
+
+    def __init__(self, root):
+        self.root = root
+        self.log_queue = queue.Queue()
+        self.file_log = setup_logging(os.path.join(get_app_dir(), LOG_FILE))
+        self.root.title("DjayNowplaying")
+        self.root.geometry("600x450")
+        
+        # Resolve DB Path
+        self.db_path = self.resolve_db_path()
+        if not self.db_path:
+            # If user cancelled or failed to pick, we can't proceed.
+            # We schedule destroy to happen after init returns
+            self.root.after(100, self.root.destroy)
+            return
+
+        # Status Frame
+        status_frame = tk.Frame(root, pady=10)
+        status_frame.pack(fill=tk.X, padx=10)
+        
+        # The port is only known once the server is bound
+        self.port = None
+        self.url = ""
+        
+        tk.Label(status_frame, text="Server Status:", font=("Arial", 10, "bold")).pack(side=tk.LEFT)
+        tk.Label(status_frame, text="Running", fg="green").pack(side=tk.LEFT, padx=5)
+        
+        # DB Path Display
+        db_frame = tk.Frame(root, pady=2)
+        db_frame.pack(fill=tk.X, padx=10)
+        tk.Label(db_frame, text="Database:", font=("Arial", 9, "bold")).pack(side=tk.LEFT)
+        self.db_label = tk.Label(db_frame, text=os.path.basename(self.db_path), fg="#555")
+        self.db_label.pack(side=tk.LEFT, padx=5)
+        
+        # URL Frame
+        url_frame = tk.Frame(root, pady=5)
+        url_frame.pack(fill=tk.X, padx=10)
+        
+        tk.Label(url_frame, text="Monitor URL:").pack(side=tk.LEFT)
+        self.url_link = url_link = tk.Label(url_frame, text=self.url, fg="blue", cursor="hand2")
+        url_link.pack(side=tk.LEFT, padx=5)
+        url_link.bind("<Button-1>", lambda e: webbrowser.open(self.url))
+        
+        tk.Button(url_frame, text="Settings", command=self.open_settings).pack(side=tk.RIGHT, padx=5)
+        tk.Button(url_frame, text="Open Browser", command=lambda: webbrowser.open(self.url)).pack(side=tk.RIGHT)
+
+        # Log Area
+        tk.Label(root, text="Activity Log:", anchor="w").pack(fill=tk.X, padx=10, pady=(10,0))
+        self.log_area = scrolledtext.ScrolledText(root, height=15)
+        self.log_area.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.root.after(self.LOG_FLUSH_MS, self.flush_log)
+        
+        if not HAS_MUTAGEN:
+            self.log("Warning: 'mutagen' library not found. Artwork extraction disabled.")
+            self.log("Run 'pip install mutagen' to enable artwork support.")
+        
+        # Start Threads
+        self.start_threads()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def open_settings(self):
+        # Reload config to ensure freshness
+        load_config()
+        
+        settings_win = tk.Toplevel(self.root)
+        settings_win.title("Settings")
+        settings_win.geometry("400x400")
+        
+        # DB Path
+        tk.Label(settings_win, text="Database Path:").pack(anchor="w", padx=10, pady=(10, 0))
+        db_frame = tk.Frame(settings_win)
+        db_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        db_var = tk.StringVar(master=settings_win, value=current_config.get("db_path", ""))
+        tk.Entry(db_frame, textvariable=db_var).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        def browse_db():
+            path = filedialog.askopenfilename(
+                parent=settings_win,
+                title="Select MediaLibrary.db",
+                filetypes=[("SQLite Database", "*.db"), ("All Files", "*.*")]
+            )
+            if path: db_var.set(path)
+            
+        tk.Button(db_frame, text="Browse", command=browse_db).pack(side=tk.RIGHT, padx=(5, 0))
+        
+        # Port
+        tk.Label(settings_win, text="Web Server Port:").pack(anchor="w", padx=10, pady=(10, 0))
+        port_var = tk.IntVar(master=settings_win, value=current_config.get("port", 8000))
+        tk.Entry(settings_win, textvariable=port_var).pack(fill=tk.X, padx=10, pady=5)
+        
+        # Poll Interval
+        tk.Label(settings_win, text="Poll Interval (seconds):").pack(anchor="w", padx=10, pady=(10, 0))
+        poll_var = tk.DoubleVar(master=settings_win, value=current_config.get("poll_interval", 0.5))
+        tk.Entry(settings_win, textvariable=poll_var).pack(fill=tk.X, padx=10, pady=5)
+        
+        # Show Source
+        show_source_var = tk.BooleanVar(master=settings_win, value=bool(current_config.get("show_source", True)))
+        tk.Checkbutton(settings_win, text="Show Streaming Service Name", variable=show_source_var).pack(anchor="w", padx=10, pady=2)
+
+        # Show History
+        show_history_var = tk.BooleanVar(master=settings_win, value=bool(current_config.get("show_history", True)))
+        tk.Checkbutton(settings_win, text="Show History Section", variable=show_history_var).pack(anchor="w", padx=10, pady=2)
+
+        # Show History Time
+        show_history_time_var = tk.BooleanVar(master=settings_win, value=bool(current_config.get("show_history_time", True)))
+        tk.Checkbutton(settings_win, text="Show History Timestamps", variable=show_history_time_var).pack(anchor="w", padx=10, pady=2)
+
+        # Save Button
+        def save():
+            try:
+                new_db = db_var.get()
+                new_port = port_var.get()
+                new_poll = poll_var.get()
+                new_show_source = show_source_var.get()
+                new_show_history = show_history_var.get()
+                new_show_history_time = show_history_time_var.get()
+                
+                if not new_db:
+                    messagebox.showerror("Error", "Database path cannot be empty.", parent=settings_win)
+                    return
+
+                if not os.path.exists(new_db):
+                    messagebox.showerror("Error", "Database file does not exist.", parent=settings_win)
+                    return
+                
+                # Update global config directly and save once
+                global current_config
+                current_config["db_path"] = new_db
+                current_config["port"] = new_port
+                current_config["poll_interval"] = new_poll
+                current_config["show_source"] = bool(new_show_source)
+                current_config["show_history"] = bool(new_show_history)
+                current_config["show_history_time"] = bool(new_show_history_time)
+                
+                save_config(current_config)
+                
+                # Apply in the background: a new database loads its artwork index first
+                threading.Thread(target=self.service.apply_config, daemon=True, name="apply-config").start()
+                
+                messagebox.showinfo("Saved", "Settings saved and applied.", parent=settings_win)
+                settings_win.destroy()
+            except Exception as e:
+                messagebox.showerror("Error", f"Invalid values: {e}", parent=settings_win)
+
+        tk.Button(settings_win, text="Save Settings", command=save, bg="#e1e1e1", height=4).pack(pady=20, fill=tk.X, padx=20)
+
+    def resolve_db_path(self):
+        # 1./2. Config or default location
+        path = find_db_path()
+        if path:
+            return path
+        user_profile = get_user_profile()
+        
+        # 3. Ask user
+        messagebox.showinfo(
+            "Database Not Found", 
+            "Could not automatically find 'MediaLibrary.db'.\n\n"
+            "Please locate it manually.\n"
+            "Typical location: Music -> djay -> djay Media Library"
+        )
+        
+        initial_dir = os.path.join(user_profile, 'Music') if user_profile else "/"
+        selected_path = filedialog.askopenfilename(
+            title="Select MediaLibrary.db",
+            filetypes=[("SQLite Database", "*.db"), ("All Files", "*.*")],
+            initialdir=initial_dir
+        )
+        
+        if selected_path:
+            update_config("db_path", selected_path)
+            return selected_path
+            
+        return None
+
+    def log(self, message):
+        # Safe from any thread: messages are queued and drained in batches by flush_log
+        self.log_queue.put(message)
+        self.file_log(message)
+
+    def flush_log(self):
+        """Append queued messages in one insert and trim the widget to log_lines"""
+        messages = []
+        try:
+            while len(messages) < self.LOG_BATCH:
+                messages.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if messages:
+            self.log_area.insert(tk.END, "\n".join(messages) + "\n")
+            lines = int(self.log_area.index("end-1c").split(".")[0]) - 1
+            max_lines = max(1, int(current_config.get("log_lines", 1000)))
+            if lines > max_lines:
+                self.log_area.delete("1.0", f"{lines - max_lines + 1}.0")
+            self.log_area.see(tk.END)
+        self.refresh_status()
+        self.root.after(self.LOG_FLUSH_MS, self.flush_log)
+
+    def refresh_status(self):
+        """Show the port and database the service is actually using (they change on a live reload)"""
+        if self.service.port is not None and self.service.port != self.port:
+            self.port = self.service.port
+            self.url = f"http://localhost:{self.port}"
+            self.url_link.config(text=self.url)
+        if self.service.db_path and self.service.db_path != self.db_path:
+            self.db_path = self.service.db_path
+            self.db_label.config(text=os.path.basename(self.db_path))
+
+    def start_threads(self):
+        self.service = NowPlayingService('', self.log_callback_safe, find_port=True)
+
+        # Start Server
+        try:
+            self.service.start_server()
+        except Exception as e:
+            self.log(f"Server Error: {e}")
+
+        # Start Monitor
+        self.service.start_monitors(self.db_path)
+        self.refresh_status()
+
+        # Pick up edits to config.json made outside the Settings window
+        self.config_watcher = ConfigWatcher(self.service, self.log_callback_safe)
+        self.config_watcher.start()
+
+    def on_close(self):
+        """Stop like the headless mode does, so plays still in the history batch are saved"""
+        self.config_watcher.stop()
+        self.service.stop()
+        play_history.close()
+        self.root.destroy()
+
+    def log_callback_safe(self, message):
+        self.log(message)
+
+LOG_FILE = "DjayNowplaying.log"
+LOG_FILE_BYTES = 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+def parse_args(argv=None):
+    """Command line flags; each falls back to a DJAY_NOWPLAYING_* environment variable, then config.json"""
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="Now playing monitor and web overlay for djay")
+    parser.add_argument("--headless", action="store_true", default=env("DJAY_NOWPLAYING_HEADLESS", "") not in ("", "0"),
+                        help="run without the window (servers, containers)")
+    parser.add_argument("--db", default=env("DJAY_NOWPLAYING_DB"), help="path to MediaLibrary.db")
+    parser.add_argument("--host", default=env("DJAY_NOWPLAYING_HOST", ""), help="address to listen on (default: all)")
+    parser.add_argument("--port", type=int, default=env("DJAY_NOWPLAYING_PORT"), help="web server port")
+    parser.add_argument("--poll-interval", type=float, default=env("DJAY_NOWPLAYING_POLL_INTERVAL"))
+    parser.add_argument("--detection-mode", choices=["poll", "events"], default=env("DJAY_NOWPLAYING_DETECTION_MODE"))
+    parser.add_argument("--log-file", default=env("DJAY_NOWPLAYING_LOG_FILE"), help="also append the log to this file")
+    parser.add_argument("--ingest-token", default=env("DJAY_NOWPLAYING_INGEST_TOKEN"),
+                        help="accept detections from agents that send this token")
+    parser.add_argument("--push-url", default=env("DJAY_NOWPLAYING_PUSH_URL"),
+                        help="agent mode: send detections to this server")
+    parser.add_argument("--push-token", default=env("DJAY_NOWPLAYING_PUSH_TOKEN"))
+    parser.add_argument("--channel", default=env("DJAY_NOWPLAYING_CHANNEL"), help="channel to push to")
+    return parser.parse_args(argv)
+
+def apply_args(args):
+    """Override config values for this run only; config.json is left untouched"""
+    overrides = {"db_path": args.db, "port": args.port, "poll_interval": args.poll_interval,
+                 "detection_mode": args.detection_mode, "ingest_token": args.ingest_token,
+                 "push_url": args.push_url, "push_token": args.push_token, "push_channel": args.channel}
+    for key, value in overrides.items():
+        if value is not None:
+            config_overrides[key] = value
+            current_config[key] = value
+
+def setup_logging(log_file=None, stream=None):
+    """Logger writing to a rotating log_file and/or a stream; returns its info() as a log callback"""
+    logger = logging.getLogger("DjayNowplaying")
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter("%(asctime)s %(message)s", "%Y-%m-%d %H:%M:%S")
+    handlers = []
+    if stream is not None:
+        handlers.append(logging.StreamHandler(stream))
+    if log_file:
+        try:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"))
+        except OSError as e:
+            print(f"Cannot open log file {log_file}: {e}")
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger.info
+
+def run_headless(args):
+    log = setup_logging(args.log_file, sys.stdout)
+
+    # Don't save: current_config may hold command line overrides
+    db_path = find_db_path(remember=False)
+    if not db_path and not (current_config.get("sources") or current_config.get("ingest_token")):
+        log("MediaLibrary.db not found. Set it with --db, DJAY_NOWPLAYING_DB or db_path in "
+            f"{os.path.join(get_app_dir(), CONFIG_FILE)}")
+        return 1
+    if not HAS_MUTAGEN:
+        log("Warning: 'mutagen' library not found. Artwork extraction disabled.")
+
+    stop = threading.Event()
+    def request_stop(signum, frame):
+        stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, request_stop)
+
+    service = NowPlayingService(args.host, log)
+    try:
+        service.start_server()
+    except OSError as e:
+        log(f"Cannot listen on port {current_config.get('port', 8000)}: {e}")
+        return 1
+    service.start_monitors(db_path)
+    if current_config.get("ingest_token"):
+        log("Accepting detections from agents at /api/ingest")
+    config_watcher = ConfigWatcher(service, log)
+    config_watcher.start()
+
+    while not stop.wait(1.0):
+        pass
+
+    log("Shutting down...")
+    config_watcher.stop()
+    service.stop()
+    play_history.close()
+    return 0
+
+def run_gui():
+    # Tk is only needed (and only slows startup) when there is a window
+    global tk, scrolledtext, filedialog, messagebox
+    import tkinter as tk
+    from tkinter import scrolledtext, filedialog, messagebox
+    root = tk.Tk()
+    app = MonitorGUI(root)
+    root.mainloop()
+
+def main():
+    args = parse_args()
+    load_config()
+    apply_args(args)
+    if args.headless:
+        sys.exit(run_headless(args))
+    run_gui()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Micro-benchmark for the djay blob decoder
+# Usage: python tools/bench_decoder.py [blob_count]
+# License: MIT
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from DjayNowplaying import decode_blob
+from sample_blobs import sample_corpus
+
+def legacy_parse_blob(blob_data):
+    """The pre-decoder implementation, kept here as the baseline"""
+    strings = re.findall(b'[a-zA-Z0-9\\s_\\.\\-\\(\\)\\&\\\'\\,\\[\\]\\!\\?]+', blob_data)
+    decoded = []
+    for s in strings:
+        d = s.decode('utf-8', errors='ignore').strip()
+        if len(d) > 1: decoded.append(d)
+    title = artist = source = None
+    for i, s in enumerate(decoded):
+        if s == 'title' and i > 0:
+            title = decoded[i-1]
+        elif s == 'artist' and i > 0:
+            artist = decoded[i-1]
+        elif s == 'originSourceID' and i > 0:
+            source = decoded[i-1]
+    return artist, title, source
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    corpus = sample_corpus(count)
+    total_kb = sum(len(b) for b in corpus) / 1024
+
+    def run_legacy():
+        for blob in corpus: legacy_parse_blob(blob)
+
+    def run_decoder():
+        for blob in corpus: decode_blob(blob, want_source=True)
+
+    def run_decoder_path():
+        for blob in corpus: decode_blob(blob, want_path=True)
+
+    print(f"Corpus: {count} blobs, {total_kb:.0f} KiB")
+    for name, fn in (("legacy findall", run_legacy), ("decode_blob", run_decoder), ("decode_blob (path)", run_decoder_path)):
+        best = min(timeit.repeat(fn, number=5, repeat=5)) / 5
+        print(f"{name:<20} {best * 1e6 / count:8.2f} us/blob")
+
+    # Non-ASCII titles must survive decoding intact
+    mismatched = 0
+    for blob in corpus:
+        legacy = legacy_parse_blob(blob)
+        record = decode_blob(blob, want_source=True)
+        if record.title is not None and legacy[1] != record.title:
+            mismatched += 1
+    print(f"Titles the legacy parser truncated or lost: {mismatched}")
+
+if __name__ == "__main__":
+    main()
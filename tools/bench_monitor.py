@@ -0,0 +1,138 @@
+# End-to-end benchmarks for PlaybackMonitor against a synthetic library
+# Measures ArtworkManager startup (cold/warm), index memory, detection latency
+# from history insert to publish, artwork fill latency and idle CPU per poll.
+# Usage: python tools/bench_monitor.py [--tracks 20000] [--plays 20] [--idle 5]
+# License: MIT
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import DjayNowplaying as app
+from synth_library import Replayer, create_library
+
+def quiet(message):
+    pass
+
+def summarize(samples_ms):
+    samples = sorted(samples_ms)
+    if not samples:
+        return "no samples"
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return (f"p50 {pick(0.5):.1f}  p90 {pick(0.9):.1f}  max {samples[-1]:.1f} ms"
+            f"  (mean {statistics.mean(samples):.1f}, n={len(samples)})")
+
+def bench_startup(db_path):
+    index_path = os.path.join(app.get_app_dir(), "artwork_index.json")
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    tracemalloc.start()
+    start = time.perf_counter()
+    manager = app.ArtworkManager(db_path, app.LibraryConnection(db_path), quiet)
+    cold = time.perf_counter() - start
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    app.ArtworkManager(db_path, app.LibraryConnection(db_path), quiet)
+    warm = time.perf_counter() - start
+    print(f"ArtworkManager startup: cold {cold * 1000:.0f} ms, warm {warm * 1000:.0f} ms "
+          f"({len(manager.path_cache)} paths)")
+    print(f"Artwork index memory:   {index_bytes / 1024 / 1024:.1f} MiB")
+
+def bench_detection(db_path, library, mode, plays):
+    """Insert history rows one at a time and time how long each takes to reach clients"""
+    app.current_config["detection_mode"] = mode
+    hub = app.MonitorHub(app.get_sources(db_path), quiet)
+    hub.start()
+    time.sleep(0.5) # Let it set the watermark
+    monitor = hub.monitors[0]
+    channel = app.get_channel()
+    replayer = Replayer(db_path, library)
+    broadcaster = channel.broadcaster
+    detect_ms, artwork_ms = [], []
+    try:
+        for i in range(plays):
+            # Distinct tracks, so dedup never hides one; the first `media` have real files
+            artist, title, _ = library[i]
+            version = broadcaster.version
+            _, _, inserted = replayer.play(artist, title)
+            if not broadcaster.wait_for(version, timeout=10):
+                print(f"  {mode}: track {i} was not detected")
+                continue
+            detect_ms.append((time.perf_counter() - inserted) * 1000)
+            if channel.state.current.get("has_artwork") == "pending":
+                version = broadcaster.version
+                broadcaster.wait_for(version, timeout=10)
+                artwork_ms.append((time.perf_counter() - inserted) * 1000)
+            # Random phase against the poll timer, like a DJ loading tracks
+            time.sleep(random.uniform(0.05, monitor.poll_interval + 0.05))
+    finally:
+        replayer.close()
+    print(f"Detection latency ({mode}): {summarize(detect_ms)}")
+    if artwork_ms:
+        print(f"Artwork latency ({mode}):   {summarize(artwork_ms)}")
+    return hub
+
+def bench_idle_cpu(monitor, seconds):
+    """Process CPU time while nothing is played; the monitor is the only busy thread"""
+    scheduler = monitor.scheduler
+    stats = monitor.library.stats
+    queries = stats["queries"]
+    polls = scheduler.polls if scheduler else 0
+    cpu = time.process_time()
+    time.sleep(seconds)
+    cpu = time.process_time() - cpu
+    polls = scheduler.polls - polls if scheduler else seconds / monitor.poll_interval
+    mode = "adaptive" if scheduler else f"fixed {monitor.poll_interval}s"
+    print(f"Idle CPU (poll, {mode}): {cpu / seconds * 100:.2f}%, {polls:.0f} polls "
+          f"(avg {seconds / max(polls, 1):.2f}s), ~{cpu / max(polls, 1) * 1e6:.0f} us/poll, "
+          f"{stats['queries'] - queries} queries")
+
+def main():
+    parser = argparse.ArgumentParser(description="PlaybackMonitor benchmarks on a synthetic library")
+    parser.add_argument("--tracks", type=int, default=20000, help="localMediaItemLocations rows")
+    parser.add_argument("--history", type=int, default=2000, help="existing historySessionItems rows")
+    parser.add_argument("--media", type=int, default=10, help="tracks with real tagged files")
+    parser.add_argument("--plays", type=int, default=20, help="tracks replayed per detection mode")
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds of idle CPU measurement")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary library")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="djay-bench-")
+    app.app_dir = os.path.join(work_dir, "config") # Keep caches away from the real config folder
+    os.makedirs(app.app_dir)
+    try:
+        start = time.perf_counter()
+        db_path, library = create_library(work_dir, args.tracks, args.history, args.media)
+        print(f"Library: {args.tracks} tracks, {args.history} history rows, "
+              f"{args.media} media files ({time.perf_counter() - start:.1f} s to build)")
+        bench_startup(db_path)
+        for mode in ("poll", "events"):
+            hub = bench_detection(db_path, library, mode, args.plays)
+            if mode == "poll":
+                bench_idle_cpu(hub.monitors[0], args.idle)
+            hub.stop()
+            hub.join(5)
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak = peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024 # KiB on Linux, bytes on macOS
+            print(f"Peak RSS: {peak:.0f} MiB")
+        except ImportError:
+            pass
+    finally:
+        if args.keep:
+            print(f"Library kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Load test for the DjayNowplaying web server
+# Usage:
+#   python tools/loadtest.py --url http://localhost:8000/api/now_playing --clients 50 --duration 10
+#   python tools/loadtest.py --serve   (starts an in-process server to test against)
+# License: MIT
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def poller(host, port, path, deadline, interval, latencies, errors):
+    """One client polling over a single keep-alive connection"""
+    conn = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=10)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+            else:
+                latencies.append(time.perf_counter() - start)
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            if conn is not None:
+                conn.close()
+            conn = None
+        if interval:
+            time.sleep(max(0, interval - (time.perf_counter() - start)))
+    if conn is not None:
+        conn.close()
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent pollers against the now-playing server")
+    parser.add_argument('--url', default='http://localhost:8000/api/now_playing')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--interval', type=float, default=0.0,
+                        help="Seconds between requests per client (0 = as fast as possible)")
+    parser.add_argument('--serve', action='store_true', help="Start an in-process server and test that")
+    args = parser.parse_args()
+
+    url = urllib.parse.urlsplit(args.url)
+    host, port, path = url.hostname, url.port or 80, url.path or '/'
+    if args.serve:
+        import DjayNowplaying
+        server = DjayNowplaying.NowPlayingServer(('127.0.0.1', 0), DjayNowplaying.RequestHandler,
+                                                 max_clients=args.clients + 8)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = '127.0.0.1', server.server_port
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=poller, args=(host, port, path, deadline, args.interval, latencies, errors))
+               for _ in range(args.clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{args.clients} clients, {elapsed:.1f} s against http://{host}:{port}{path}")
+    print(f"requests: {len(latencies)}  errors: {len(errors)}  rate: {len(latencies) / elapsed:.0f} req/s")
+    print(f"latency ms: p50 {percentile(latencies, 50) * 1000:.1f}  p90 {percentile(latencies, 90) * 1000:.1f}  "
+          f"p99 {percentile(latencies, 99) * 1000:.1f}  max {(latencies[-1] if latencies else 0) * 1000:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Replay tests for the duplicate filter (RecentTracks)
+# Feeds recorded detection sequences through RecentTracks.is_duplicate with fixed
+# timestamps and checks each verdict, so changes to the dedup rules can be re-checked.
+# Usage: python tools/replay_dedup.py [-v]
+# License: MIT
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import DjayNowplaying as app
+
+NEW, DUP = False, True
+
+# name -> (window, [(seconds, artist, title, deck, expected), ...])
+SCENARIOS = {
+    "window expiry": (5.0, [
+        (0.0, "Daft Punk", "One More Time", None, NEW),
+        (1.0, "Daft Punk", "One More Time", None, DUP),
+        (4.9, "Daft Punk", "One More Time", None, DUP),
+        (5.0, "Daft Punk", "One More Time", None, NEW), # Window is measured from the accepted play
+        (7.0, "Daft Punk", "Aerodynamic", None, NEW),
+        (11.9, "Daft Punk", "Aerodynamic", None, DUP),
+        (12.0, "Daft Punk", "Aerodynamic", None, NEW),
+    ]),
+    "normalized keys": (5.0, [
+        (0.0, "Daft Punk", "One More Time", None, NEW),
+        (0.5, "DAFT PUNK", "one more time", None, DUP),
+        (1.0, "  Daft   Punk ", "One  More\tTime", None, DUP),
+        (1.5, "Ro\u0301isi\u0301n Murphy", "Overpowered", None, NEW), # Decomposed accents
+        (2.0, "R\u00f3is\u00edn Murphy", "Overpowered", None, DUP), # Same name, composed
+        (2.5, "Daft Punk", "One More Time (Edit)", None, NEW),
+        (3.0, None, "Untitled", None, NEW),
+        (3.5, "", "untitled", None, DUP),
+    ]),
+    "two decks, same track": (5.0, [
+        (0.0, "Moderat", "A New Error", "1", NEW),
+        (2.0, "Moderat", "A New Error", "2", DUP), # Loaded on the other deck to mix into itself
+        (60.0, "Moderat", "A New Error", "2", NEW), # Later play from the other deck is a real replay
+        (61.0, "Moderat", "A New Error", "1", DUP),
+    ]),
+    "same deck re-log": (5.0, [
+        (0.0, "Bicep", "Glue", "1", NEW),
+        (30.0, "Bicep", "Glue", "1", DUP), # Re-logged by its deck, nothing played in between
+        (90.0, "Bicep", "Glue", "1", DUP),
+        (120.0, "Bicep", "Apricots", "2", NEW),
+        (180.0, "Bicep", "Glue", "1", NEW), # Something else played since: a new play
+        (240.0, "Bicep", "Glue", None, NEW), # No deck in the row: only the window applies
+    ]),
+}
+
+def replay(window, steps):
+    """Return a list of (step, got) for every verdict that differs from the expected one"""
+    recent = app.RecentTracks(window)
+    failures = []
+    for step in steps:
+        seconds, artist, title, deck, expected = step
+        got = recent.is_duplicate(artist, title, deck, now=seconds)
+        if got != expected:
+            failures.append((step, got))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay detection sequences through the duplicate filter")
+    parser.add_argument('-v', '--verbose', action='store_true', help="list every step")
+    args = parser.parse_args()
+
+    failed = 0
+    for name, (window, steps) in SCENARIOS.items():
+        failures = replay(window, steps)
+        print(f"{'FAIL' if failures else 'ok  '} {name} ({len(steps)} steps)")
+        if args.verbose:
+            for seconds, artist, title, deck, expected in steps:
+                print(f"       {seconds:6.1f}s deck {deck}: {artist} - {title} -> {'dup' if expected else 'new'}")
+        for (seconds, artist, title, deck, expected), got in failures:
+            print(f"       at {seconds:.1f}s deck {deck}: {artist} - {title}: "
+                  f"expected {'dup' if expected else 'new'}, got {'dup' if got else 'new'}")
+        failed += bool(failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
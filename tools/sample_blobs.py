@@ -0,0 +1,56 @@
+# Sample djay record blobs for benchmarks and offline testing
+# License: MIT
+import random
+import struct
+import urllib.parse
+
+ARTISTS = ["Daft Punk", "Röyksopp", "Sigur Rós", "坂本龍一", "Amélie Lens", "DJ Koze",
+           "Charlotte de Witte", "Bicep", "Nina Kraviz", "Four Tet", "Björk", "Kölsch"]
+WORDS = ["Night", "Drive", "Échos", "Horizon", "Glue", "Rêverie", "Atlas", "Lumière", "夜",
+         "Signal", "Pulse", "Tide", "Ünder", "Motion", "Café", "Static", "Orbit"]
+SOURCES = ["explorer", "soundcloud", "tidal", "beatport", "applemusic"]
+
+def encode_string(value):
+    return b'\x08' + value.encode('utf-8') + b'\x00'
+
+def encode_blob(fields, numbers=None):
+    """Build a blob in djay's layout: each value is written right before its key"""
+    out = bytearray(b'TSAF\x00\x03\x00\x00')
+    out += struct.pack('<I', len(fields))
+    for key, value in fields.items():
+        out += encode_string(value) + encode_string(key)
+    for key, value in (numbers or {}).items():
+        out += b'\x0c' + struct.pack('<d', value) + encode_string(key)
+    return bytes(out)
+
+def random_track(rng):
+    artist = rng.choice(ARTISTS)
+    title = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+    if rng.random() < 0.3:
+        title += rng.choice([" (Original Mix)", " - Extended", " [Remastered]", " #2", " feat. Ø"])
+    return artist, title
+
+def history_blob(artist, title, source="explorer", rng=None):
+    rng = rng or random
+    return encode_blob(
+        {"title": title, "artist": artist, "originSourceID": source,
+         "uuid": "%032x" % rng.getrandbits(128)},
+        {"startTime": rng.uniform(7e8, 8e8), "duration": rng.uniform(120, 480)},
+    )
+
+def location_blob(artist, title, path):
+    url = "file:///" + urllib.parse.quote(path.replace('\\', '/').lstrip('/'))
+    return encode_blob({"title": title, "artist": artist, "album": "Sample", "url": url},
+                       {"fileSize": 1e7})
+
+def sample_corpus(count=1000, seed=1):
+    """Mixed list of historySessionItems and localMediaItemLocations blobs"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        artist, title = random_track(rng)
+        if i % 2:
+            corpus.append(history_blob(artist, title, rng.choice(SOURCES), rng))
+        else:
+            corpus.append(location_blob(artist, title, f"/Music/{artist}/{title}.mp3"))
+    return corpus
@@ -0,0 +1,77 @@
+# Stand-in receiver for the webhook and UDP output sinks
+# Prints every track it gets; --fail and --delay make the webhook misbehave so
+# retry/backoff and coalescing can be watched in DjayNowplaying's log.
+# Usage:
+#   python tools/sink_receiver.py --http 9000 --udp 9001 [--fail 0.5] [--delay 2]
+#   config.json: "sinks": [{"type": "webhook", "url": "http://localhost:9000/"},
+#                          {"type": "udp", "host": "127.0.0.1", "port": 9001}]
+# License: MIT
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def show(kind, body):
+    try:
+        message = json.loads(body)
+        track = message.get("track", {})
+        text = f"{track.get('artist')} - {track.get('title')} (play {message.get('play_id')}, " \
+               f"channel {message.get('channel')}, artwork {track.get('has_artwork')})"
+    except ValueError:
+        text = f"invalid JSON: {body[:80]!r}"
+    print(f"[{time.strftime('%H:%M:%S')}] {kind}: {text}", flush=True)
+
+def make_handler(fail, delay):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(delay)
+            if random.random() < fail:
+                print(f"[{time.strftime('%H:%M:%S')}] webhook: answering 503", flush=True)
+                self.send_error(503)
+                return
+            show("webhook", body)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+    return WebhookHandler
+
+def listen_udp(port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    while True:
+        data, address = sock.recvfrom(65535)
+        show(f"udp {address[0]}", data)
+
+def main():
+    parser = argparse.ArgumentParser(description="Print what the DjayNowplaying output sinks send")
+    parser.add_argument('--http', type=int, default=9000, help="webhook port (0 to disable)")
+    parser.add_argument('--udp', type=int, default=9001, help="UDP port (0 to disable)")
+    parser.add_argument('--fail', type=float, default=0.0, help="fraction of webhooks answered with 503")
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds before answering a webhook")
+    args = parser.parse_args()
+
+    if args.udp:
+        threading.Thread(target=listen_udp, args=(args.udp,), daemon=True).start()
+        print(f"Listening for UDP on port {args.udp}")
+    if args.http:
+        server = ThreadingHTTPServer(('', args.http), make_handler(args.fail, args.delay))
+        print(f"Listening for webhooks on http://localhost:{args.http}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Concurrency stress test for the published now-playing state
+# One writer announces tracks and fills in their artwork (sometimes too late, after a
+# newer track) while reader threads check every snapshot they see: current must be the
+# newest history item with the same artwork, history must be complete and in order,
+# and neither the state nor the encoded payload may ever go backwards.
+# Usage: python tools/stress_state.py [--readers 8] [--duration 5]
+# License: MIT
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import DjayNowplaying as app
+
+ARTWORK_KEYS = ("has_artwork", "artwork_id")
+
+def check_snapshot(current, history, last):
+    """Problems with one (current, history) snapshot; last is (seq, has_artwork) seen before"""
+    if not history:
+        return ["empty history"] if current.get("seq") is not None else []
+    head = history[0]
+    problems = []
+    if current.get("seq") != head.get("seq") or current.get("title") != head.get("title"):
+        problems.append(f"current is track {current.get('seq')} but history starts at {head.get('seq')}")
+    elif any(current.get(key) != head.get(key) for key in ARTWORK_KEYS):
+        problems.append(f"track {head['seq']}: artwork {[current.get(k) for k in ARTWORK_KEYS]} "
+                        f"on air vs {[head.get(k) for k in ARTWORK_KEYS]} in history")
+    seqs = [item.get("seq") for item in history]
+    if seqs != list(range(seqs[0], seqs[0] - len(seqs), -1)) or len(seqs) > app.HISTORY_SIZE:
+        problems.append(f"history out of order or incomplete: {seqs}")
+    if any(item.get("has_artwork") == "pending" for item in history[1:]):
+        problems.append("an older track is still pending artwork")
+    seq, has_artwork = current.get("seq") or 0, current.get("has_artwork")
+    if seq < last[0] or (seq == last[0] and last[1] is True and has_artwork == "pending"):
+        problems.append(f"went backwards: track {last[0]} ({last[1]}) -> {seq} ({has_artwork})")
+    return problems
+
+def writer(channel, stop, fill_rate, counts):
+    seq = 0
+    pending = []
+    while not stop.is_set():
+        seq += 1
+        track = {"artist": "Stress", "title": f"Track {seq}", "seq": seq, "status": "Playing",
+                 "has_artwork": "pending", "artwork_id": None}
+        pending.append(channel.announce(track))
+        counts["announced"] += 1
+        # Fill the newest job most of the time, occasionally an older one that must be dropped
+        while pending and random.random() < fill_rate:
+            generation, history_item = pending.pop(random.randrange(len(pending)))
+            filled = channel.fill_artwork(generation, history_item,
+                                          {"has_artwork": True, "artwork_id": f"art{history_item['seq']}"})
+            counts["filled" if filled else "stale"] += 1
+        del pending[:-3]
+
+def reader(channel, stop, results):
+    last_state, last_payload, version = (0, None), (0, None), 0
+    states = payloads = 0
+    problems = []
+    while not stop.is_set() and len(problems) < 10:
+        state = channel.state
+        found = check_snapshot(state.current, state.history, last_state)
+        last_state = (state.current.get("seq") or 0, state.current.get("has_artwork"))
+        states += 1
+        payload = channel.broadcaster.payload
+        if payload is not None and payload.version != version:
+            response = json.loads(payload.body)
+            if payload.version < version or response.get("version") != payload.version:
+                found.append(f"payload version {payload.version} after {version} (body says {response.get('version')})")
+            found += [f"payload: {p}" for p in check_snapshot(response["current"], response["history"], last_payload)]
+            last_payload = (response["current"].get("seq") or 0, response["current"].get("has_artwork"))
+            version = payload.version
+            payloads += 1
+        problems += found
+    results.append((states, payloads, problems))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that readers never see a torn now-playing state")
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds")
+    parser.add_argument('--fill', type=float, default=0.7, help="chance of filling artwork after each announce")
+    parser.add_argument('--switch', type=float, default=1e-5,
+                        help="interpreter switch interval; small values force more interleavings")
+    args = parser.parse_args()
+
+    sys.setswitchinterval(args.switch)
+    channel = app.Channel("stress")
+    stop = threading.Event()
+    counts = {"announced": 0, "filled": 0, "stale": 0}
+    results = []
+    threads = [threading.Thread(target=reader, args=(channel, stop, results)) for _ in range(args.readers)]
+    threads.append(threading.Thread(target=writer, args=(channel, stop, args.fill, counts)))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    problems = [problem for _, _, found in results for problem in found]
+    print(f"Writer: {counts['announced']} announced, {counts['filled']} artwork fills, "
+          f"{counts['stale']} stale fills dropped")
+    print(f"Readers: {sum(r[0] for r in results)} state snapshots, "
+          f"{sum(r[1] for r in results)} payloads checked by {args.readers} threads")
+    for problem in problems[:20]:
+        print(f"  {problem}")
+    print(f"{len(problems)} problems" if problems else "OK: no torn or out-of-order reads")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Synthetic djay library for offline testing and benchmarks
+# Builds a MediaLibrary.db with djay's database2 table, tagged MP3/FLAC files
+# with embedded artwork, and replays history rows into it like a live set.
+# Usage:
+#   python tools/synth_library.py generate OUT_DIR [--tracks 2000] [--history 200] [--media 40]
+#   python tools/synth_library.py replay OUT_DIR/MediaLibrary.db [--interval 5] [--count 20]
+# License: MIT
+import argparse
+import os
+import random
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sample_blobs import SOURCES, history_blob, location_blob, random_track
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS database2 (
+        rowid INTEGER PRIMARY KEY,
+        collection CHAR NOT NULL,
+        key CHAR NOT NULL,
+        data BLOB,
+        metadata BLOB
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS database2_collection_key ON database2 (collection, key);
+"""
+
+def make_png(rgb, size=64):
+    """Solid-colour PNG, so every track gets distinct, decodable artwork"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    row = b'\x00' + bytes(rgb) * size
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * size))
+            + chunk(b'IEND', b''))
+
+def write_mp3(path, artist, title, cover):
+    """A few silent MPEG-1 Layer III frames with ID3 title/artist/cover"""
+    from mutagen.id3 import ID3, TIT2, TPE1, APIC
+    frame = b'\xff\xfb\x90\x64' + b'\x00' * 413 # 128 kbps, 44.1 kHz: 417 bytes per frame
+    with open(path, 'wb') as f:
+        f.write(frame * 20)
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    tags.add(TPE1(encoding=3, text=artist))
+    tags.add(APIC(encoding=3, mime='image/png', type=3, desc='Cover', data=cover))
+    tags.save(path)
+
+def write_flac(path, artist, title, cover):
+    """A FLAC header without audio, plus Vorbis comments and a picture block"""
+    from mutagen.flac import FLAC, Picture
+    # STREAMINFO: 4096-sample blocks, 44.1 kHz, stereo, 16 bit, length unknown
+    streaminfo = struct.pack('>HH', 4096, 4096) + b'\x00' * 6
+    streaminfo += struct.pack('>Q', (44100 << 44) | (1 << 41) | (15 << 36)) + b'\x00' * 16
+    with open(path, 'wb') as f:
+        f.write(b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo)
+    audio = FLAC(path)
+    audio['title'] = title
+    audio['artist'] = artist
+    picture = Picture()
+    picture.type = 3
+    picture.mime = 'image/png'
+    picture.data = cover
+    audio.add_picture(picture)
+    audio.save()
+
+def create_library(out_dir, tracks=2000, history=200, media=40, seed=1):
+    """Write out_dir/MediaLibrary.db and media files; returns (db_path, [(artist, title, path)])"""
+    rng = random.Random(seed)
+    out_dir = os.path.abspath(out_dir) # Location rows hold file:/// URLs, which must be absolute
+    media_dir = os.path.join(out_dir, 'Music')
+    os.makedirs(media_dir, exist_ok=True)
+    db_path = os.path.join(out_dir, 'MediaLibrary.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    library = []
+    seen = set()
+    while len(library) < tracks:
+        artist, title = random_track(rng)
+        if (artist, title) in seen:
+            title += f" {len(library)}"
+        seen.add((artist, title))
+        index = len(library)
+        ext = '.flac' if index % 2 else '.mp3'
+        path = os.path.join(media_dir, f"{index:05d}{ext}")
+        if index < media:
+            cover = make_png((rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            (write_flac if ext == '.flac' else write_mp3)(path, artist, title, cover)
+        library.append((artist, title, path))
+
+    with conn:
+        conn.executemany("INSERT INTO database2 (collection, key, data) VALUES ('localMediaItemLocations', ?, ?)",
+                         [(f"loc-{i}", location_blob(a, t, p)) for i, (a, t, p) in enumerate(library)])
+        conn.executemany("INSERT INTO database2 (collection, key, data) VALUES ('historySessionItems', ?, ?)",
+                         [(f"hist-{i}", history_blob(*pick_history(library, rng), rng=rng)) for i in range(history)])
+    conn.close()
+    return db_path, library
+
+def pick_history(library, rng):
+    """Random track as (artist, title, source); local files are played from 'explorer'"""
+    artist, title, _ = rng.choice(library)
+    source = 'explorer' if rng.random() < 0.7 else rng.choice(SOURCES)
+    return artist, title, source
+
+def load_library(db_path):
+    """(artist, title, file URL) for every location row of an existing library"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from DjayNowplaying import decode_blob
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT data FROM database2 WHERE collection='localMediaItemLocations'").fetchall()
+    conn.close()
+    return [(r.artist, r.title, r.path) for r in (decode_blob(data, want_path=True) for (data,) in rows)]
+
+class Replayer:
+    """Inserts history rows the way djay does when a track is loaded"""
+    def __init__(self, db_path, library, seed=2):
+        self.conn = sqlite3.connect(db_path)
+        self.library = library
+        self.rng = random.Random(seed)
+        self.count = 0
+
+    def play(self, artist=None, title=None, source='explorer'):
+        """Insert one history row; returns (artist, title, commit time from time.perf_counter())"""
+        if artist is None:
+            artist, title, source = pick_history(self.library, self.rng)
+        self.count += 1
+        key = f"replay-{os.getpid()}-{time.time_ns()}-{self.count}"
+        with self.conn:
+            self.conn.execute("INSERT INTO database2 (collection, key, data) VALUES ('historySessionItems', ?, ?)",
+                              (key, history_blob(artist, title, source, self.rng)))
+        return artist, title, time.perf_counter()
+
+    def run(self, count, interval):
+        for i in range(count):
+            artist, title, _ = self.play()
+            print(f"[{time.strftime('%H:%M:%S')}] {artist} - {title}")
+            if i + 1 < count:
+                time.sleep(interval)
+
+    def close(self):
+        self.conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic djay MediaLibrary.db generator and history replayer")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="create MediaLibrary.db and media files in a directory")
+    generate.add_argument("out_dir")
+    generate.add_argument("--tracks", type=int, default=2000, help="localMediaItemLocations rows")
+    generate.add_argument("--history", type=int, default=200, help="historySessionItems rows")
+    generate.add_argument("--media", type=int, default=40, help="tracks that get a real tagged MP3/FLAC file")
+    generate.add_argument("--seed", type=int, default=1)
+    replay = commands.add_parser("replay", help="insert history rows into a library on a schedule")
+    replay.add_argument("db_path")
+    replay.add_argument("--interval", type=float, default=5.0, help="seconds between tracks")
+    replay.add_argument("--count", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        start = time.perf_counter()
+        db_path, library = create_library(args.out_dir, args.tracks, args.history, args.media, args.seed)
+        print(f"{db_path}: {len(library)} tracks, {args.history} history rows, "
+              f"{min(args.media, args.tracks)} media files in {time.perf_counter() - start:.1f} s")
+    else:
+        replayer = Replayer(args.db_path, load_library(args.db_path))
+        try:
+            replayer.run(args.count, args.interval)
+        finally:
+            replayer.close()
+
+if __name__ == "__main__":
+    main()